@@ -0,0 +1,109 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from time import perf_counter
+
+import config
+from metrics import Metrics
+if config.STORAGE_BACKEND == "sqlite":
+    from sqlite_manage import SqliteReader as Reader
+else:
+    from data_manage import Reader
+
+
+# методы, меняющие данные: выполняются по одному и не пересекаются с чтением
+WRITE_METHODS = {"add_event_theme", "add_event", "add_team", "add_member_to_team", "accept_member", "remove_member",
+                 "flip_team_opened", "change_team_needs", "delete_team", "delete_event"}
+
+
+class ReadWriteLock:
+    def __init__(self):
+        self.readers = 0
+        self.writer = False
+        self.waiting_writers = 0
+        self.condition = asyncio.Condition()
+
+
+    async def acquire_read(self):
+        async with self.condition:
+            # ожидающий писатель имеет приоритет, чтобы поток чтений не откладывал запись бесконечно
+            await self.condition.wait_for(lambda: not self.writer and not self.waiting_writers)
+            self.readers += 1
+
+
+    async def release_read(self):
+        async with self.condition:
+            self.readers -= 1
+            if not self.readers:
+                self.condition.notify_all()
+
+
+    async def acquire_write(self):
+        async with self.condition:
+            self.waiting_writers += 1
+            try:
+                await self.condition.wait_for(lambda: not self.writer and not self.readers)
+            except BaseException:
+                # отмененный писатель больше не ждет, иначе чтения, пропускающие его вперед, ждали бы бесконечно
+                self.waiting_writers -= 1
+                self.condition.notify_all()
+                raise
+            self.waiting_writers -= 1
+            self.writer = True
+
+
+    async def release_write(self):
+        async with self.condition:
+            self.writer = False
+            self.condition.notify_all()
+
+
+class AsyncReader:
+    def __new__(cls):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(AsyncReader, cls).__new__(cls)
+            cls.instance.__initialized = False
+        return cls.instance
+
+
+    def __init__(self):
+        if self.__initialized:
+            return
+        self.__initialized = True
+        self.reader = Reader()
+        self.executor = ThreadPoolExecutor(max_workers=config.READER_WORKERS, thread_name_prefix="reader")
+        self.lock = ReadWriteLock()
+        self.metrics = Metrics()
+
+
+    def __getattr__(self, name):
+        method = getattr(self.reader, name)
+        if name in WRITE_METHODS:
+            acquire, release = self.lock.acquire_write, self.lock.release_write
+        else:
+            acquire, release = self.lock.acquire_read, self.lock.release_read
+
+        async def call(*args, **kwargs):
+            await acquire()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self.executor, partial(method, *args, **kwargs))
+            finally:
+                await release()
+
+        async def metered_call(*args, **kwargs):
+            # ожидание блокировки и время самого метода в потоке учитываются отдельно
+            start = perf_counter()
+            await acquire()
+            self.metrics.reader_wait_seconds.observe(perf_counter() - start, "write" if name in WRITE_METHODS else "read")
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self.executor, partial(timed, *args, **kwargs))
+            finally:
+                await release()
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.metrics.reader_seconds.observe(perf_counter() - start, name)
+        return metered_call if self.metrics.enabled else call
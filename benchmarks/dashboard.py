@@ -0,0 +1,79 @@
+# Стоимость одного отображения экрана команды (/my_teams):
+# прежняя последовательность из пяти запросов к Reader против get_team_dashboard.
+#
+#   python benchmarks/dashboard.py [--teams 1000] [--repeat 2000] [--backend xlsx|sqlite]
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+from time import perf_counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from data_manage import Reader
+from sqlite_manage import SqliteReader
+
+
+def fill(reader, teams, members):
+    theme = {"theme": "", "company": "Компания", "max_teams": 10, "responsible": "Ответственный", "email": "mail@example.com",
+             "description": "Описание", "background": None, "problem": "Проблема", "expected_result": "Результат"}
+    themes = [dict(theme, theme=f"Тема {index}") for index in range(teams // 5 + 1)]
+    reader.add_event("Мероприятие", 1, "organizer", members + 1, themes)
+    event_hash = reader.get_events()[0]['event_hash']
+    themes = reader.get_all_themes(event_hash)
+    user_id = 1000
+    for index in range(teams):
+        leader_id = user_id = user_id + 1
+        reader.add_team(event_hash, themes[index // 5]['theme_hash'], f"Команда {index}", leader_id, f"user{leader_id}", "Ищем всех")
+        team_hash = reader.get_team_info(leader_id, event_hash)['team_hash']
+        for _ in range(members):
+            user_id += 1
+            reader.add_member_to_team(user_id, f"user{user_id}", event_hash, team_hash)
+            reader.accept_member(event_hash, team_hash, user_id)
+    return event_hash, list(range(1001, user_id + 1))
+
+
+def render_separately(reader, member_id, event_hash):
+    team_info = reader.get_team_info(member_id, event_hash)
+    team_info['event_hash'] = reader.get_event_name(event_hash)
+    team_info['theme_hash'] = reader.get_theme_name(event_hash, team_info['theme_hash'])
+    team_info['members'] = f"{reader.get_current_members(event_hash, team_info['team_hash'])}/{reader.get_max_members(event_hash)}"
+    return team_info
+
+
+def measure(function, reader, users, event_hash, repeat):
+    start = perf_counter()
+    for index in range(repeat):
+        function(reader, users[index % len(users)], event_hash)
+    return (perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--teams", type=int, default=1000)
+    parser.add_argument("--members", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--backend", choices=["xlsx", "sqlite"], default="xlsx")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    shutil.copy(os.path.join(ROOT, "data.xlsx"), directory)
+    os.chdir(directory)
+    try:
+        reader = SqliteReader() if args.backend == "sqlite" else Reader()
+        event_hash, users = fill(reader, args.teams, args.members)
+        old = measure(render_separately, reader, users, event_hash, args.repeat)
+        new = measure(lambda reader, member_id, event_hash: reader.get_team_dashboard(member_id, event_hash),
+                      reader, users, event_hash, args.repeat)
+        print(f"{args.backend}: команд {args.teams}, участников {len(users)}")
+        print(f"  отдельные запросы:   {old:8.1f} мкс на отображение")
+        print(f"  get_team_dashboard:  {new:8.1f} мкс на отображение")
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# Сравнение Reader (xlsx) и SqliteReader на одинаковых случайных последовательностях изменений.
+#
+#   python benchmarks/equivalence.py [--seeds 20] [--steps 2000] [--tier tiny]
+#
+# Оба хранилища загружают одни и те же сгенерированные данные, затем получают одни и те же вызовы.
+# Результат каждого изменения и ответы методов чтения по затронутому мероприятию должны совпадать;
+# при первом расхождении печатается шаг и оба ответа, код возврата 1.
+import os
+import gc
+import sys
+import shutil
+import random
+import argparse
+import tempfile
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from generate import Dataset, TIERS
+
+
+def load(data):
+    import sqlite_manage
+    from data_manage import Reader
+    data.write_snapshot("data.pkl")
+    reader = Reader()
+    with contextlib.redirect_stdout(sys.stderr):
+        sqlite_manage.migrate()
+    return reader, sqlite_manage.SqliteReader()
+
+
+def close():
+    import sqlite_manage
+    from data_manage import Reader
+    for cls in [Reader, sqlite_manage.SqliteReader]:
+        if hasattr(cls, "instance"):
+            if getattr(cls.instance, "log_file", None):
+                cls.instance.log_file.close()
+            del cls.instance
+    gc.collect()
+
+
+def normalize(value):
+    # numpy-числа и bool из pandas против int из sqlite
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+def event_state(reader, event_hash, users):
+    # ответы, которые видят пользователи мероприятия
+    state = {"themes": reader.get_all_themes(event_hash)}
+    teams = {}
+    for theme in state['themes']:
+        state[f"teams_to_join {theme['theme_hash']}"] = reader.get_teams_to_join(0, event_hash, theme['theme_hash'])
+    for user in users:
+        state[f"themes_to_join {user}"] = reader.get_themes_to_join(user, event_hash)
+        state[f"themes_to_create {user}"] = reader.get_themes_to_create(user, event_hash)
+        team = reader.get_team_info(user, event_hash)
+        state[f"team_info {user}"] = team
+        if team:
+            teams[team['team_hash']] = team['leader_id']
+    for team_hash, leader_id in teams.items():
+        state[f"members {team_hash}"] = reader.get_current_members(event_hash, team_hash)
+        state[f"not_accepted {team_hash}"] = reader.get_not_accepted_members(event_hash, team_hash)
+        state[f"team_members {team_hash}"] = reader.get_team_members(leader_id, event_hash, team_hash)
+    return normalize(state)
+
+
+def step(rand, reader, users):
+    # действие выбирается по данным Reader, оба хранилища получают одинаковые аргументы
+    event_hash = rand.choice(list(reader.event_rows))
+    teams = list(reader.event_teams.get(event_hash, {})) or [0]
+    team_hash = rand.choice(teams)
+    user = rand.choice(users)
+    action = rand.choices(["add_team", "add_member_to_team", "accept_member", "remove_member", "flip_team_opened",
+                           "change_team_needs", "delete_team", "delete_event"],
+                          weights=[10, 30, 25, 10, 5, 5, 4, 0.3])[0]
+    if action == "add_team":
+        theme_hash = rand.choice(list(reader.event_themes.get(event_hash, {})) or [0])
+        if not reader.is_create_theme_available(user, event_hash, theme_hash):
+            return event_hash, None
+        return event_hash, (action, event_hash, theme_hash, f"Команда {user}", user, f"user{user}", "Ищем")
+    if action == "add_member_to_team":
+        return event_hash, (action, user, f"user{user}", event_hash, team_hash)
+    if action in ("accept_member", "remove_member"):
+        # чаще всего - пользователь, уже отправивший запрос в эту команду
+        members = list(reader.team_members.get((event_hash, team_hash), {}))
+        member = rand.choice(members) if members and rand.random() < 0.8 else user
+        return event_hash, (action, event_hash, team_hash, member)
+    if action == "change_team_needs":
+        return event_hash, (action, event_hash, team_hash, f"Ищем {user}")
+    if action == "delete_team":
+        return event_hash, (action, event_hash, team_hash, user)
+    if action == "delete_event":
+        if len(reader.event_rows) == 1:
+            return event_hash, None
+        return event_hash, (action, event_hash)
+    return event_hash, (action, event_hash, team_hash)
+
+
+def run_seed(seed, steps, tier):
+    data = Dataset(**TIERS[tier], seed=seed)
+    rand = random.Random(seed)
+    directory = tempfile.mkdtemp()
+    os.chdir(directory)
+    try:
+        reader, sqlite_reader = load(data)
+        # небольшой круг пользователей, чтобы запросы, принятия и создание команд пересекались
+        users = [data.user() for _ in range(12)] + [data.outsider() for _ in range(4)]
+        for number in range(steps):
+            event_hash, call = step(rand, reader, users)
+            if call is None:
+                continue
+            results = [normalize(getattr(backend, call[0])(*call[1:])) for backend in (reader, sqlite_reader)]
+            if call[0] in ("delete_team", "delete_event"):
+                # список получателей уведомления, порядок не важен
+                results = [sorted(result) for result in results]
+            if results[0] != results[1]:
+                return f"шаг {number} {call}: xlsx {results[0]}, sqlite {results[1]}"
+            if event_hash not in reader.event_rows:
+                continue
+            states = [event_state(backend, event_hash, users) for backend in (reader, sqlite_reader)]
+            if states[0] != states[1]:
+                diff = {key: (states[0].get(key), states[1].get(key)) for key in states[0].keys() | states[1].keys()
+                        if states[0].get(key) != states[1].get(key)}
+                return f"шаг {number} {call}: состояние расходится {diff}"
+        return None
+    finally:
+        close()
+        os.chdir(ROOT)
+        shutil.rmtree(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seeds", type=int, default=20)
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--tier", choices=list(TIERS), default="tiny")
+    args = parser.parse_args()
+
+    failed = 0
+    for seed in range(args.seeds):
+        error = run_seed(seed, args.steps, args.tier)
+        print(f"seed {seed}: {error or 'OK'}")
+        failed += error is not None
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
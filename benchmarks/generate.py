@@ -0,0 +1,147 @@
+# Детерминированный генератор данных для бенчмарков Reader.
+#
+# Мероприятие содержит themes тем, в каждой теме teams команд, в каждой команде members принятых участников
+# (включая лидера) и pending запросов. Пользователи разбиты на USER_GROUPS групп: пользователь участвует
+# в каждом USER_GROUPS-м мероприятии, поэтому get_member_events возвращает несколько мероприятий.
+import pickle
+import random
+
+import numpy as np
+import pandas as pd
+
+from data_manage import THEME_COLUMNS, TEAM_COLUMNS
+
+TIERS = {
+    "tiny": dict(events=10, themes=10, teams=2, members=3, pending=1),
+    "small": dict(events=100, themes=10, teams=2, members=4, pending=1),
+    "medium": dict(events=1000, themes=10, teams=2, members=4, pending=1),
+    "large": dict(events=10000, themes=10, teams=2, members=4, pending=1),
+}
+USER_GROUPS = 100
+FIRST_USER = 100000
+
+
+class Dataset:
+    def __init__(self, events, themes, teams, members, pending, seed=0):
+        self.events = events
+        self.themes = themes
+        self.teams = teams
+        self.members = members
+        self.pending = pending
+        self.rows_per_team = members + pending
+        self.teams_per_event = themes * teams
+        self.users_per_event = self.teams_per_event * self.rows_per_team
+        self.random = random.Random(seed)
+        # пользователи, которых нет в сгенерированных данных, для создания команд и запросов
+        self.next_outsider = FIRST_USER + USER_GROUPS * self.users_per_event
+
+
+    def sizes(self):
+        teams = self.events * self.teams_per_event
+        return {"events": self.events, "themes": self.events * self.themes, "teams": teams,
+                "members": teams * self.rows_per_team}
+
+
+    def user_id(self, event_hash, local_team, row):
+        return FIRST_USER + (event_hash - 1) % USER_GROUPS * self.users_per_event + local_team * self.rows_per_team + row
+
+
+    def frames(self):
+        event_hash = np.arange(1, self.events + 1)
+        event_df = pd.DataFrame({
+            "event": [f"Мероприятие {index}" for index in event_hash],
+            "organizer_id": 10 + event_hash % 50,
+            "alias": [f"org{10 + index % 50}" for index in event_hash],
+            # запас мест, чтобы в командах оставалось место для новых запросов
+            "max_members": self.rows_per_team + 1,
+            "event_hash": event_hash,
+        })
+
+        theme_hash = np.arange(1, self.events * self.themes + 1)
+        theme_df = pd.DataFrame({"event_hash": (theme_hash - 1) // self.themes + 1})
+        for column in THEME_COLUMNS:
+            theme_df[column] = f"{column}"
+        theme_df['theme'] = [f"Тема {index}" for index in theme_hash]
+        theme_df['max_teams'] = self.teams + 1
+        theme_df['background'] = None
+        theme_df['theme_hash'] = theme_hash
+
+        team_index = np.arange(self.events * self.teams_per_event)
+        team_event = team_index // self.teams_per_event + 1
+        local_team = team_index % self.teams_per_event
+        leader_id = self.user_id(team_event, local_team, 0)
+        team_df = pd.DataFrame({
+            "event_hash": team_event,
+            "theme_hash": team_index // self.teams + 1,
+            "team_name": [f"Команда {index}" for index in team_index],
+            "leader_id": leader_id,
+            "leader_alias": [f"user{user}" for user in leader_id],
+            "team_opened": team_index % 5 != 4,
+            "team_needs": "Ищем участников",
+            "team_hash": team_index + 1,
+        })[TEAM_COLUMNS]
+
+        row = np.tile(np.arange(self.rows_per_team), len(team_index))
+        member_team = np.repeat(team_index, self.rows_per_team)
+        member_event = member_team // self.teams_per_event + 1
+        member_id = self.user_id(member_event, member_team % self.teams_per_event, row)
+        member_df = pd.DataFrame({
+            "member_id": member_id,
+            "alias": [f"user{user}" for user in member_id],
+            "event_hash": member_event,
+            "team_hash": member_team + 1,
+            "accepted": row < self.members,
+        })
+
+        meta = {"log_seq": 0, "event_hash": self.events + 1, "theme_hash": self.events * self.themes + 1,
+                "team_hash": self.events * self.teams_per_event + 1}
+        return [event_df, theme_df, team_df, member_df], meta
+
+
+    def write_snapshot(self, url):
+        # формат data.pkl: Reader загрузит его при запуске и построит индексы
+        frames, meta = self.frames()
+        with open(url, "wb") as snapshot:
+            pickle.dump((frames, meta), snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+    def event(self):
+        return self.random.randint(1, self.events)
+
+
+    def team(self):
+        # (event_hash, theme_hash, team_hash, локальный номер команды в мероприятии)
+        team_index = self.random.randrange(self.events * self.teams_per_event)
+        return (team_index // self.teams_per_event + 1, team_index // self.teams + 1, team_index + 1,
+                team_index % self.teams_per_event)
+
+
+    def team_key(self):
+        event_hash, theme_hash, team_hash, local_team = self.team()
+        return event_hash, team_hash
+
+
+    def theme(self):
+        theme_index = self.random.randrange(self.events * self.themes)
+        return theme_index // self.themes + 1, theme_index + 1
+
+
+    def leader(self):
+        event_hash, theme_hash, team_hash, local_team = self.team()
+        return event_hash, team_hash, self.user_id(event_hash, local_team, 0)
+
+
+    def member(self, accepted=True):
+        event_hash, theme_hash, team_hash, local_team = self.team()
+        row = self.random.randrange(1, self.members) if accepted else self.random.randrange(self.members, self.rows_per_team)
+        return event_hash, team_hash, self.user_id(event_hash, local_team, row)
+
+
+    def user(self):
+        event_hash, theme_hash, team_hash, local_team = self.team()
+        return self.user_id(event_hash, local_team, self.random.randrange(self.rows_per_team))
+
+
+    def outsider(self):
+        self.next_outsider += 1
+        return self.next_outsider
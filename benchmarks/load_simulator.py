@@ -0,0 +1,425 @@
+# Нагрузка на настоящие обработчики бота: Application из main.build_application получает синтетические обновления,
+# а запросы к Bot API отвечаются подставным BaseRequest с заданной задержкой.
+#
+#   python benchmarks/load_simulator.py --users 2000 --tier small [--api-latency 50] [--ramp 10] [--output result.json]
+#
+# Каждый пользователь проходит один сценарий (/create_event, /create_team, /join_team, /my_teams или /themes),
+# нажимая кнопки из последнего полученного сообщения. Результат - JSON: задержка каждого обработчика и каждого
+# шага сценария (p50/p90/p99/max в миллисекундах), число обновлений в секунду и вызовы Bot API по методам.
+import os
+import sys
+import json
+import random
+import shutil
+import asyncio
+import argparse
+import logging
+import tempfile
+from io import BytesIO
+from time import perf_counter, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd
+
+from generate import Dataset, TIERS
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Бот", "username": "team_seeker_bot"}
+FLOWS = ["create_team", "join_team", "my_teams", "themes", "create_event"]
+
+
+class Latencies:
+    def __init__(self):
+        self.samples = {}
+
+
+    def add(self, name, seconds):
+        self.samples.setdefault(name, []).append(seconds)
+
+
+    def report(self):
+        result = {}
+        for name, samples in sorted(self.samples.items()):
+            samples = sorted(samples)
+            result[name] = {"count": len(samples), "mean_ms": round(sum(samples) / len(samples) * 1e3, 2),
+                            **{f"p{point}_ms": round(samples[min(len(samples) - 1, int(len(samples) * point / 100))] * 1e3, 2)
+                               for point in (50, 90, 99)},
+                            "max_ms": round(samples[-1] * 1e3, 2)}
+        return result
+
+
+def themes_file():
+    from data_manage import THEME_COLUMNS
+    themes = pd.DataFrame([{**{column: column for column in THEME_COLUMNS}, "theme": f"Тема {index}", "max_teams": 3,
+                            "background": None} for index in range(20)])
+    content = BytesIO()
+    themes.to_excel(content, index=False)
+    return content.getvalue()
+
+
+def telegram_request_class():
+    from telegram.request import BaseRequest
+
+    class FakeRequest(BaseRequest):
+        # отвечает на запросы бота как Bot API, запоминает клавиатуры сообщений для пользователей симуляции
+        def __init__(self, latency, jitter, themes):
+            self.latency = latency
+            self.jitter = jitter
+            self.themes = themes
+            self.message_id = 0
+            self.calls = {}
+            # chat_id -> (message_id, [callback_data]) последнего сообщения с inline-клавиатурой
+            self.screens = {}
+
+
+        @property
+        def read_timeout(self):
+            return None
+
+
+        async def initialize(self):
+            pass
+
+
+        async def shutdown(self):
+            pass
+
+
+        def next_message(self, chat_id, text):
+            self.message_id += 1
+            return {"message_id": self.message_id, "date": int(time()), "chat": {"id": chat_id, "type": "private"},
+                    "from": BOT_USER, "text": text}
+
+
+        def set_screen(self, chat_id, message_id, markup):
+            buttons = [str(button["callback_data"]) for row in (markup or {}).get("inline_keyboard", []) for button in row]
+            self.screens[chat_id] = (message_id, buttons)
+
+
+        async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                             connect_timeout=None, pool_timeout=None):
+            if self.latency:
+                await asyncio.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+            if method == "GET":
+                # скачивание файла с темами
+                self.calls["download"] = self.calls.get("download", 0) + 1
+                return 200, self.themes
+
+            name = url.rsplit("/", 1)[-1]
+            self.calls[name] = self.calls.get(name, 0) + 1
+            params = request_data.parameters if request_data else {}
+            result = True
+            if name == "getMe":
+                result = {**BOT_USER, "can_join_groups": True, "can_read_all_group_messages": False,
+                          "supports_inline_queries": False}
+            elif name in ("sendMessage", "sendDocument"):
+                result = self.next_message(params["chat_id"], params.get("text", ""))
+                if params.get("reply_markup", {}).get("inline_keyboard"):
+                    self.set_screen(params["chat_id"], result["message_id"], params["reply_markup"])
+            elif name in ("editMessageText", "editMessageReplyMarkup"):
+                chat_id = params["chat_id"]
+                result = {**self.next_message(chat_id, params.get("text", "")), "message_id": params["message_id"]}
+                if self.screens.get(chat_id, (None,))[0] == params["message_id"]:
+                    self.set_screen(chat_id, params["message_id"], params.get("reply_markup"))
+            elif name == "getFile":
+                result = {"file_id": params["file_id"], "file_unique_id": params["file_id"],
+                          "file_size": len(self.themes), "file_path": "documents/themes.xlsx"}
+            return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    return FakeRequest
+
+
+class Simulator:
+    def __init__(self, application, request, data, think):
+        self.application = application
+        self.request = request
+        self.data = data
+        self.think = think
+        self.update_id = 0
+        self.message_id = 10 ** 9
+        # update_id -> (future, название шага, время отправки)
+        self.waiting = {}
+        self.steps = Latencies()
+        self.flows = Latencies()
+        self.handlers = Latencies()
+        self.errors = 0
+
+
+    def instrument(self):
+        from telegram.ext import ConversationHandler
+        process_update = self.application.process_update
+
+        async def timed_process_update(update):
+            try:
+                await process_update(update)
+            finally:
+                future, step, sent = self.waiting.pop(update.update_id)
+                self.steps.add(step, perf_counter() - sent)
+                if not future.done():
+                    future.set_result(None)
+
+        self.application.process_update = timed_process_update
+
+        def timed(callback):
+            async def wrapper(update, context):
+                start = perf_counter()
+                try:
+                    return await callback(update, context)
+                finally:
+                    self.handlers.add(callback.__name__, perf_counter() - start)
+            return wrapper
+
+        for handlers in self.application.handlers.values():
+            for handler in handlers:
+                if isinstance(handler, ConversationHandler):
+                    inner = handler.entry_points + [state for states in handler.states.values() for state in states] + handler.fallbacks
+                else:
+                    inner = [handler]
+                for callback_handler in inner:
+                    callback_handler.callback = timed(callback_handler.callback)
+
+        async def count_error(update, context):
+            self.errors += 1
+            logging.getLogger(__name__).error("Ошибка в обработчике", exc_info=context.error)
+
+        self.application.add_error_handler(count_error)
+
+
+    async def send(self, step, update):
+        from telegram import Update
+        self.update_id += 1
+        update["update_id"] = self.update_id
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[self.update_id] = (future, step, perf_counter())
+        await self.application.update_queue.put(Update.de_json(update, self.application.bot))
+        await future
+        if self.think:
+            await asyncio.sleep(random.expovariate(1 / self.think))
+
+
+    @staticmethod
+    def user(user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "username": f"user{user_id}"}
+
+
+    def message(self, user_id, **content):
+        self.message_id += 1
+        return {"message_id": self.message_id, "date": int(time()), "chat": {"id": user_id, "type": "private"},
+                "from": self.user(user_id), **content}
+
+
+    async def text(self, user_id, text, step=None):
+        entities = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}] if text.startswith("/") else []
+        await self.send(step or text, {"message": self.message(user_id, text=text, entities=entities)})
+
+
+    async def document(self, user_id, step):
+        document = {"file_id": f"themes{user_id}", "file_unique_id": f"themes{user_id}", "file_name": "themes.xlsx",
+                    "file_size": len(self.request.themes)}
+        await self.send(step, {"message": self.message(user_id, document=document)})
+
+
+    def buttons(self, user_id, special=False):
+        # special=False - кнопки выбора (мероприятие, тема, команда), True - служебные вида "next#"
+        message_id, buttons = self.request.screens.get(user_id, (None, []))
+        return [button for button in buttons if button.endswith("#") == special]
+
+
+    async def click(self, user_id, data, step):
+        message_id, buttons = self.request.screens.get(user_id, (None, []))
+        if data not in buttons:
+            return False
+        message = {"message_id": message_id, "date": int(time()), "chat": {"id": user_id, "type": "private"},
+                   "from": BOT_USER, "text": ""}
+        query = {"id": str(self.update_id), "from": self.user(user_id), "chat_instance": str(user_id), "data": data,
+                 "message": message}
+        await self.send(step, {"callback_query": query})
+        return True
+
+
+    async def choose(self, user_id, step):
+        choices = self.buttons(user_id)
+        if not choices:
+            return False
+        return await self.click(user_id, random.choice(choices), step)
+
+
+    async def pick_event(self, user_id, command):
+        # список мероприятий не листается, поэтому выбирается мероприятие из сгенерированных данных
+        await self.text(user_id, command)
+        event_hash = str(self.data.event())
+        if event_hash not in self.request.screens.get(user_id, (None, []))[1]:
+            return await self.choose(user_id, f"{command} event")
+        return await self.click(user_id, event_hash, f"{command} event")
+
+
+    async def create_team(self, user_id):
+        if not await self.pick_event(user_id, "/create_team"):
+            return
+        if not await self.choose(user_id, "/create_team theme"):
+            return
+        if not await self.click(user_id, "next#", "/create_team confirm"):
+            return
+        await self.text(user_id, f"Команда {user_id}", "/create_team name")
+        await self.text(user_id, "Ищем разработчиков", "/create_team description")
+
+
+    async def join_team(self, user_id):
+        if not await self.pick_event(user_id, "/join_team"):
+            return
+        if not await self.choose(user_id, "/join_team theme"):
+            return
+        if not await self.click(user_id, "next#", "/join_team confirm"):
+            return
+        if not await self.choose(user_id, "/join_team team"):
+            return
+        await self.click(user_id, "join#", "/join_team request")
+
+
+    async def my_teams(self, user_id):
+        await self.text(user_id, "/my_teams")
+        if not await self.choose(user_id, "/my_teams event"):
+            return
+        if "answer#" in self.buttons(user_id, special=True):
+            await self.click(user_id, "answer#", "/my_teams requests")
+            if await self.choose(user_id, "/my_teams request"):
+                await self.click(user_id, random.choice(["confirm#", "reject#"]), "/my_teams answer")
+        await self.text(user_id, "/cancel")
+
+
+    async def themes(self, user_id):
+        if not await self.pick_event(user_id, "/themes"):
+            return
+        if random.random() < 0.5:
+            await self.click(user_id, "next#", "/themes page")
+        await self.choose(user_id, "/themes theme")
+
+
+    async def create_event(self, user_id):
+        await self.text(user_id, "/create_event")
+        await self.text(user_id, f"Новое мероприятие {user_id}", "/create_event name")
+        await self.text(user_id, "5", "/create_event max_members")
+        await self.document(user_id, "/create_event themes")
+
+
+    async def run_user(self, flow, user_id, delay):
+        await asyncio.sleep(delay)
+        start = perf_counter()
+        await getattr(self, flow)(user_id)
+        self.flows.add(flow, perf_counter() - start)
+
+
+def plan(data, users, weights, ramp):
+    # лидеры существующих команд проверяют запросы, остальные сценарии выполняют новые пользователи
+    flows = random.choices(FLOWS, weights=[weights[flow] for flow in FLOWS], k=users)
+    leaders = set()
+    result = []
+    for index, flow in enumerate(flows):
+        if flow == "my_teams":
+            user_id = data.leader()[2]
+            while user_id in leaders:
+                user_id = data.leader()[2]
+            leaders.add(user_id)
+        else:
+            user_id = data.outsider()
+        result.append((flow, user_id, ramp * index / users))
+    return result
+
+
+async def simulate(args, data):
+    from telegram.ext import Application, DictPersistence
+    import main
+    from async_reader import Reader
+    from notifications import Notifier, DigestQueue
+    from persistence import SqlitePersistence
+
+    start = perf_counter()
+    Reader()
+    load_seconds = perf_counter() - start
+
+    FakeRequest = telegram_request_class()
+    request = FakeRequest(args.api_latency / 1e3, args.jitter, themes_file())
+    builder = Application.builder().token("1:simulation").request(request).get_updates_request(FakeRequest(0, 0, b""))
+    # диалоги объявлены persistent=True, поэтому без SqlitePersistence состояние хранится только в памяти
+    builder.persistence(SqlitePersistence(main.config.PERSISTENCE_URL, main.config.PERSISTENCE_INTERVAL)
+                        if args.persistence else DictPersistence())
+    application = main.build_application(builder)
+    simulator = Simulator(application, request, data, args.think / 1e3)
+    simulator.instrument()
+
+    random.seed(args.seed)
+    users = plan(data, args.users, {flow: getattr(args, flow) for flow in FLOWS}, args.ramp)
+    async with application:
+        await application.start()
+        try:
+            start = perf_counter()
+            await asyncio.gather(*[simulator.run_user(*user) for user in users])
+            elapsed = perf_counter() - start
+        finally:
+            await application.stop()
+
+    # уведомления отправляются в фоне с ограничением скорости, в отчет попадает то, что успело уйти
+    notifications = {"notifier": Notifier().stats(), "digest": DigestQueue().stats()}
+    for task in Notifier().tasks | DigestQueue().tasks:
+        task.cancel()
+
+    updates = sum(len(samples) for samples in simulator.steps.samples.values())
+    return {"tier": args.tier, "backend": main.config.STORAGE_BACKEND, "users": args.users,
+            "concurrent_updates": main.config.CONCURRENT_UPDATES, "api_latency_ms": args.api_latency,
+            "persistence": args.persistence, "sizes": data.sizes(), "load_seconds": round(load_seconds, 3),
+            "elapsed_seconds": round(elapsed, 3), "updates": updates,
+            "updates_per_sec": round(updates / elapsed, 1), "errors": simulator.errors,
+            "api_calls": dict(sorted(request.calls.items())), "notifications": notifications,
+            "handlers": simulator.handlers.report(), "steps": simulator.steps.report(), "flows": simulator.flows.report()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000, help="число пользователей, каждый проходит один сценарий")
+    parser.add_argument("--tier", choices=list(TIERS), default="small", help="размер данных из generate.py")
+    parser.add_argument("--backend", choices=["xlsx", "sqlite"], default=os.environ.get("STORAGE_BACKEND", "xlsx"))
+    parser.add_argument("--concurrent-updates", type=int, default=int(os.environ.get("CONCURRENT_UPDATES", 0)))
+    parser.add_argument("--api-latency", type=float, default=50, help="задержка ответа Bot API в миллисекундах")
+    parser.add_argument("--jitter", type=float, default=0.5, help="разброс задержки: доля от --api-latency")
+    parser.add_argument("--think", type=float, default=0, help="средняя пауза пользователя между действиями, мс")
+    parser.add_argument("--ramp", type=float, default=0, help="секунд, за которые начинают работу все пользователи")
+    parser.add_argument("--no-persistence", dest="persistence", action="store_false")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="файл для JSON, по умолчанию stdout")
+    for flow, weight in zip(FLOWS, [10, 60, 15, 14, 1]):
+        parser.add_argument(f"--{flow.replace('_', '-')}", dest=flow, type=float, default=weight,
+                            help=f"доля сценария {flow}, по умолчанию {weight}")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.WARNING)
+    # настройки читаются модулем config при импорте main
+    os.environ["STORAGE_BACKEND"] = args.backend
+    os.environ["CONCURRENT_UPDATES"] = str(args.concurrent_updates)
+
+    data = Dataset(**TIERS[args.tier])
+    directory = tempfile.mkdtemp()
+    shutil.copy(os.path.join(ROOT, "Шаблон.xlsx"), directory)
+    os.chdir(directory)
+    try:
+        data.write_snapshot("data.pkl")
+        if args.backend == "sqlite":
+            import contextlib
+            import sqlite_manage
+            with contextlib.redirect_stdout(sys.stderr):
+                sqlite_manage.migrate()
+        result = asyncio.run(simulate(args, data))
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(directory)
+
+    report = json.dumps(result, ensure_ascii=False, indent=1)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            output.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+# Время работы каждого публичного метода Reader на сгенерированных данных разного размера.
+#
+#   python benchmarks/reader_suite.py --tier tiny --tier small [--backend xlsx|sqlite] [--output result.json]
+#
+# Результат - JSON: для каждого размера и метода число вызовов, ops/sec, p50/p99 в микросекундах
+# и пик памяти по tracemalloc; сравнивая два файла, можно увидеть регрессии после изменения хранения.
+import os
+import gc
+import sys
+import json
+import shutil
+import argparse
+import resource
+import tempfile
+import tracemalloc
+import contextlib
+from time import perf_counter_ns
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd
+
+from data_manage import Reader, THEME_COLUMNS
+from generate import Dataset, TIERS
+
+
+def new_themes(count):
+    return [{**{column: column for column in THEME_COLUMNS}, "theme": f"Новая тема {index}", "max_teams": 3, "background": None}
+            for index in range(count)]
+
+
+def cases(data, reader):
+    # метод -> (функция, готовящая аргументы вызова, число вызовов относительно --repeat)
+    # сначала чтение, затем изменения, удаление в конце, чтобы оно не мешало остальным методам
+    pending_files = []
+
+    def themes_file():
+        url = os.path.abspath(f"themes_{len(pending_files)}.xlsx")
+        pd.DataFrame(new_themes(10)).to_excel(url, index=False)
+        pending_files.append(url)
+        return url
+
+    def leader_args():
+        event_hash, team_hash, leader_id = data.leader()
+        return leader_id, event_hash, team_hash
+
+    def member_args(accepted=True):
+        event_hash, team_hash, member_id = data.member(accepted)
+        return member_id, event_hash
+
+    deleted_teams = set()
+
+    def team_to_delete():
+        while True:
+            event_hash, team_hash, leader_id = data.leader()
+            if (event_hash, team_hash) not in deleted_teams:
+                deleted_teams.add((event_hash, team_hash))
+                return event_hash, team_hash, leader_id
+
+    deleted_events = set()
+
+    def event_to_delete():
+        # сгенерированные мероприятия и созданные add_event; на маленьких размерах их может не хватить, тогда создается новое
+        events = [event['event_hash'] for event in reader.get_events() if event['event_hash'] not in deleted_events]
+        if not events:
+            reader.add_event(f"Мероприятие для удаления {data.outsider()}", 1, "org", 5, new_themes(1))
+            return event_to_delete()
+        event_hash = data.random.choice(events)
+        deleted_events.add(event_hash)
+        return event_hash,
+
+    return [
+        ("get_events", lambda: (), 0.1),
+        ("get_event_name", lambda: (data.event(),), 1),
+        ("get_event_version", lambda: (data.event(),), 1),
+        ("is_event_name_unique", lambda: (f"Мероприятие {data.event()}",), 0.1),
+        ("is_digit", lambda: ("123",), 1),
+        ("get_all_themes", lambda: (data.event(),), 1),
+        ("get_themes_to_create", lambda: (data.outsider(), data.event()), 1),
+        ("get_themes_to_join", lambda: (data.outsider(), data.event()), 1),
+        ("get_theme_options", lambda: (data.outsider(), *data.theme()), 1),
+        ("theme_info", lambda: data.theme(), 1),
+        ("get_theme_name", lambda: data.theme(), 1),
+        ("is_create_theme_available", lambda: (data.outsider(), *data.theme()), 1),
+        ("get_teams_to_join", lambda: (data.outsider(), *data.theme()), 1),
+        ("is_team_name_unique", lambda: (data.event(), "Новая команда"), 1),
+        ("get_team_name", lambda: data.team_key(), 1),
+        ("get_team_description", lambda: data.team_key(), 1),
+        ("get_leader_id", lambda: data.team_key(), 1),
+        ("get_max_members", lambda: (data.event(),), 1),
+        ("get_current_members", lambda: data.team_key(), 1),
+        ("get_not_accepted_members", lambda: data.team_key(), 1),
+        ("get_team_members", leader_args, 1),
+        ("get_team_info", member_args, 1),
+        ("get_team_dashboard", member_args, 1),
+        ("get_member_events", lambda: (data.user(),), 1),
+        ("get_user_alias", lambda: (data.user(),), 1),
+        ("get_user_events", lambda: (10 + data.event() % 50,), 0.1),
+        ("add_event", lambda: (f"Новое мероприятие {data.outsider()}", 1, "org", 5, new_themes(10)), 0.1),
+        ("add_event_theme", lambda: (f"Новое мероприятие {data.outsider()}", 1, "org", 5, themes_file()), 0.01),
+        ("add_team", lambda: (*data.theme(), f"Новая команда {data.outsider()}", data.outsider(), "leader", "Ищем"), 0.2),
+        ("add_member_to_team", lambda: (data.outsider(), "user", *data.team_key()), 0.2),
+        ("accept_member", lambda: data.member(False), 0.2),
+        ("remove_member", lambda: data.member(), 0.2),
+        ("flip_team_opened", lambda: data.team_key(), 0.2),
+        ("change_team_needs", lambda: (*data.team_key(), "Ищем дизайнера"), 0.2),
+        ("delete_team", team_to_delete, 0.05),
+        ("delete_event", event_to_delete, 0.01),
+        ("save_data", lambda: (), 0),
+    ]
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_case(reader, name, prepare, calls):
+    method = getattr(reader, name)
+    args = [prepare() for _ in range(calls)]
+    times = []
+    for call_args in args:
+        start = perf_counter_ns()
+        method(*call_args)
+        times.append(perf_counter_ns() - start)
+
+    # память отдельным коротким проходом: tracemalloc заметно замедляет вызовы
+    memory_args = [prepare() for _ in range(min(calls, 10))]
+    tracemalloc.start()
+    for call_args in memory_args:
+        method(*call_args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    times.sort()
+    return {"calls": calls, "ops_per_sec": round(calls / (sum(times) / 1e9), 1),
+            "p50_us": round(percentile(times, 0.5) / 1e3, 1), "p99_us": round(percentile(times, 0.99) / 1e3, 1),
+            "peak_kb": round(peak / 1024, 1)}
+
+
+def load(backend, data):
+    data.write_snapshot("data.pkl")
+    if backend == "sqlite":
+        import sqlite_manage
+        with contextlib.redirect_stdout(sys.stderr):
+            sqlite_manage.migrate()
+        # данные уже в базе, таблицы pandas больше не нужны
+        Reader.instance.log_file.close()
+        del Reader.instance
+        gc.collect()
+        return sqlite_manage.SqliteReader()
+    return Reader()
+
+
+def run_tier(tier, backend, repeat, skip):
+    data = Dataset(**TIERS[tier])
+    directory = tempfile.mkdtemp()
+    os.chdir(directory)
+    try:
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = perf_counter_ns()
+        reader = load(backend, data)
+        result = {"tier": tier, "backend": backend, "sizes": data.sizes(),
+                  "load": {"seconds": round((perf_counter_ns() - start) / 1e9, 3),
+                           "max_rss_growth_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before},
+                  "methods": {}}
+        for name, prepare, share in cases(data, reader):
+            if name in skip:
+                continue
+            calls = max(1, int(repeat * share))
+            result["methods"][name] = run_case(reader, name, prepare, calls)
+            print(f"{tier:>6} {name:<26} {result['methods'][name]}", file=sys.stderr)
+        return result
+    finally:
+        for cls in [Reader] + ([sys.modules["sqlite_manage"].SqliteReader] if "sqlite_manage" in sys.modules else []):
+            if hasattr(cls, "instance"):
+                if getattr(cls.instance, "log_file", None):
+                    cls.instance.log_file.close()
+                del cls.instance
+        gc.collect()
+        os.chdir(ROOT)
+        shutil.rmtree(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tier", action="append", choices=list(TIERS), help="по умолчанию tiny, small и medium")
+    parser.add_argument("--backend", choices=["xlsx", "sqlite"], default="xlsx")
+    parser.add_argument("--repeat", type=int, default=1000, help="число вызовов методов чтения")
+    parser.add_argument("--skip", action="append", default=[], help="пропустить метод, например save_data")
+    parser.add_argument("--output", help="файл для JSON, по умолчанию stdout")
+    args = parser.parse_args()
+
+    results = [run_tier(tier, args.backend, args.repeat, set(args.skip)) for tier in args.tier or ["tiny", "small", "medium"]]
+    report = json.dumps(results, ensure_ascii=False, indent=1)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            output.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+from collections import OrderedDict
+
+import config
+
+
+class ThemeCardCache:
+    def __new__(cls):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(ThemeCardCache, cls).__new__(cls)
+            cls.instance.__initialized = False
+        return cls.instance
+
+
+    def __init__(self):
+        if self.__initialized:
+            return
+        self.__initialized = True
+        self.max_size = config.THEME_CARD_CACHE_SIZE
+        # (event_hash, theme_hash) -> текст карточки, в порядке последнего обращения
+        self.cards = OrderedDict()
+        # event_hash -> закешированные темы мероприятия, для удаления всех карточек мероприятия
+        self.event_themes = {}
+        # идентификаторы не переиспользуются, поэтому карточку удаленного мероприятия,
+        # прочитанную до удаления, можно просто не сохранять; такая карточка приходит сразу после удаления,
+        # поэтому хранятся только последние max_size удаленных мероприятий
+        self.deleted_events = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, event_hash, theme_hash):
+        card = self.cards.get((event_hash, theme_hash))
+        if card is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.cards.move_to_end((event_hash, theme_hash))
+        return card
+
+
+    def put(self, event_hash, theme_hash, card):
+        if event_hash in self.deleted_events:
+            return
+        self.cards[(event_hash, theme_hash)] = card
+        self.cards.move_to_end((event_hash, theme_hash))
+        self.event_themes.setdefault(event_hash, set()).add(theme_hash)
+        while len(self.cards) > self.max_size:
+            (old_event_hash, old_theme_hash), _ = self.cards.popitem(last=False)
+            self.event_themes[old_event_hash].discard(old_theme_hash)
+            if not self.event_themes[old_event_hash]:
+                del self.event_themes[old_event_hash]
+
+
+    def invalidate_event(self, event_hash):
+        self.deleted_events[event_hash] = None
+        while len(self.deleted_events) > self.max_size:
+            self.deleted_events.popitem(last=False)
+        for theme_hash in self.event_themes.pop(event_hash, set()):
+            del self.cards[(event_hash, theme_hash)]
+
+
+    def stats(self):
+        return {"size": len(self.cards), "hits": self.hits, "misses": self.misses}
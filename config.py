@@ -0,0 +1,48 @@
+import os
+
+
+# "xlsx" - pandas и data.xlsx с журналом data.log, "sqlite" - база SQLITE_URL
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "xlsx")
+SQLITE_URL = os.environ.get("SQLITE_URL", "data.db")
+# количество потоков, в которых выполняются запросы к Reader из обработчиков
+READER_WORKERS = int(os.environ.get("READER_WORKERS", 4))
+# 0 - обновления обрабатываются последовательно, иначе максимальное число одновременно обрабатываемых обновлений
+CONCURRENT_UPDATES = int(os.environ.get("CONCURRENT_UPDATES", 0))
+# загрузка файла с темами: максимальный размер в байтах, число одновременных загрузок и процессов для разбора
+MAX_UPLOAD_SIZE = int(os.environ.get("MAX_UPLOAD_SIZE", 5 * 1024 * 1024))
+MAX_CONCURRENT_UPLOADS = int(os.environ.get("MAX_CONCURRENT_UPLOADS", 2))
+UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", 2))
+# количество подготовленных карточек тем, хранимых в памяти
+THEME_CARD_CACHE_SIZE = int(os.environ.get("THEME_CARD_CACHE_SIZE", 1024))
+# уведомления: сообщений в секунду для всего бота, секунд между сообщениями в один чат,
+# число одновременных отправок и повторов при ошибках сети или превышении лимита
+NOTIFY_RATE = float(os.environ.get("NOTIFY_RATE", 25))
+NOTIFY_CHAT_INTERVAL = float(os.environ.get("NOTIFY_CHAT_INTERVAL", 1))
+NOTIFY_CONCURRENCY = int(os.environ.get("NOTIFY_CONCURRENCY", 20))
+NOTIFY_RETRIES = int(os.environ.get("NOTIFY_RETRIES", 5))
+# секунд, в течение которых запросы в одну команду собираются в одно уведомление лидеру
+DIGEST_WINDOW = float(os.environ.get("DIGEST_WINDOW", 5))
+BOT_TOKEN = os.environ.get("BOT_TOKEN", "7143101973:AAEqnB854KWCeQ2aVWaf4Y2qLGbt-EZTt8k")
+# адрес Bot API, можно заменить на локальный сервер Bot API или тестовый сервер
+BASE_URL = os.environ.get("BASE_URL", "https://api.telegram.org/bot")
+BASE_FILE_URL = os.environ.get("BASE_FILE_URL", "https://api.telegram.org/file/bot")
+# "polling" - long polling, "webhook" - обновления принимаются HTTP сервером бота (нужен python-telegram-bot[webhooks])
+MODE = os.environ.get("MODE", "polling")
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", 8443))
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "telegram")
+# внешний адрес, который сообщается Telegram, например https://bot.example.com/telegram; пустой - вебхук не регистрируется
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET") or None
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", 40))
+# состояния диалогов, user_data и chat_data: файл базы и интервал записи изменений в секундах
+PERSISTENCE_URL = os.environ.get("PERSISTENCE_URL", "state.db")
+PERSISTENCE_INTERVAL = float(os.environ.get("PERSISTENCE_INTERVAL", 5))
+# порт HTTP сервера с метриками в формате Prometheus (/metrics), 0 - метрики не собираются
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
+METRICS_LISTEN = os.environ.get("METRICS_LISTEN", "127.0.0.1")
+# id пользователей Telegram через запятую, которым доступны служебные команды (/profile, /memory)
+ADMIN_IDS = [int(user_id) for user_id in os.environ.get("ADMIN_IDS", "").split(",") if user_id.strip()]
+# профилирование по /profile: интервал выборки стеков в миллисекундах и максимальная длительность в секундах
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", 5))
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", 300))
@@ -1,7 +1,62 @@
 import os
+import json
+import pickle
+import logging
+from threading import Lock
+from time import perf_counter
 
 import pandas as pd
-from numpy import nan
+
+
+logger = logging.getLogger(__name__)
+
+# добавленные строки копятся в буфере, а удаленные только помечаются, пока их не наберется INSERT_BATCH
+# и 1/BATCH_RATIO от размера таблицы; тогда таблица копируется один раз, и вставка и удаление в среднем O(1)
+INSERT_BATCH = 256
+BATCH_RATIO = 8
+
+
+THEME_COLUMNS = ['theme', 'company', 'max_teams','responsible', 'email', 'description', 'background', 'problem', 'expected_result']
+TEAM_COLUMNS = ['event_hash', 'theme_hash', 'team_name', 'leader_id', 'leader_alias', 'team_opened', 'team_needs', 'team_hash']
+# типы столбцов в памяти: идентификаторы - целые фиксированной ширины (id пользователей Telegram не помещаются в int32),
+# ограничения max_* вводит пользователь без проверки диапазона, поэтому они int64;
+# флаги - bool, часто повторяющиеся строки - category; уникальные и изменяемые строки остаются строками
+COMPACT_DTYPES = {
+    "event_df": {"organizer_id": "int64", "alias": "category", "max_members": "int64", "event_hash": "int32"},
+    "theme_df": {"event_hash": "int32", "theme_hash": "int32", "max_teams": "int64", "company": "category",
+                 "responsible": "category", "email": "category"},
+    "team_df": {"event_hash": "int32", "theme_hash": "int32", "team_hash": "int32", "leader_id": "int64",
+                "leader_alias": "category", "team_opened": "bool"},
+    "member_df": {"member_id": "int64", "alias": "category", "event_hash": "int32", "team_hash": "int32", "accepted": "bool"},
+}
+
+
+def read_themes(file_url):
+    # openpyxl открывает файл в режиме read-only, строки разбираются потоково
+    df = pd.read_excel(file_url, engine='openpyxl')
+    errors = []
+
+    if df.empty:
+        errors.append(f"В файле отсутствуют данные.")
+        return errors, []
+
+    # проверка наличия заголовков
+    for col_name in THEME_COLUMNS:
+        if col_name not in df.columns:
+            errors.append(f"Отстуствует заголовок {col_name}.")
+    if errors:
+        return errors, []
+
+    not_digit = ~df['max_teams'].astype(str).str.isdigit()
+    duplicate = (df['theme'].duplicated(keep=False) | df['theme'].isna()) & ~not_digit
+    for index in df.index[not_digit | duplicate]:
+        if not_digit[index]:
+            errors.append(f"Ошибка в строке {index+2}: значение не является числом.\n    {df.at[index, 'max_teams']}")
+        else:
+            errors.append(f"Ошибка в строке {index+2}: найден дубликат.\n    {df.at[index, 'theme']}")
+    if errors:
+        return errors, []
+    return errors, df[THEME_COLUMNS].to_dict('records')
 
 
 class Reader:
@@ -17,8 +72,41 @@ class Reader:
             return
         self.__initialized = True
         self.data_url = "data.xlsx"
+        # двоичный снимок для быстрого запуска, xlsx остается читаемой выгрузкой
+        self.snapshot_url = "data.pkl"
+        self.log_url = "data.log"
         self.event_df = self.theme_df = self.team_df = self.member_df = None
+        self.log_seq = 0
+        self.log_file = None
+        # event_hash -> номер записи журнала, последней изменившей мероприятие, для проверки актуальности кешей
+        self.event_versions = {}
+        # следующий свободный идентификатор для каждого типа сущностей, None - данные в старом формате с hash()
+        self.next_ids = None
+        # lock защищает данные от изменения во время снятия снимка, save_lock - от двух одновременных сохранений
+        self.lock = Lock()
+        self.save_lock = Lock()
+        start = perf_counter()
+        source = self.load_data()
+        self.replay_log()
+        self.loaded_seq = self.log_seq
+        self.log_file = open(self.log_url, "a", encoding="utf-8")
+        logger.info("Данные загружены из %s за %.3f с, записей журнала: %d", source, perf_counter() - start, self.log_seq)
+        if self.next_ids is None:
+            self.migrate_ids()
+            self.save_data()
+        self.compact()
+
+
+    def load_data(self):
+        if (os.path.exists(self.snapshot_url) and
+            (not os.path.exists(self.data_url) or os.path.getmtime(self.snapshot_url) >= os.path.getmtime(self.data_url))):
+            with open(self.snapshot_url, "rb") as snapshot:
+                [self.event_df, self.theme_df, self.team_df, self.member_df], meta = pickle.load(snapshot)
+            self.set_meta(meta if isinstance(meta, dict) else {"log_seq": meta})
+            self.build_indexes()
+            return self.snapshot_url
         self.get_dfs()
+        return self.data_url
 
 
     def get_dfs(self):
@@ -27,10 +115,345 @@ class Reader:
         self.theme_df = pd.read_excel(excel, "Theme")
         self.team_df = pd.read_excel(excel, "Team")
         self.member_df = pd.read_excel(excel, "Member")
+        if "Meta" in excel.sheet_names:
+            self.set_meta(pd.read_excel(excel, "Meta").to_dict('records')[0])
+        self.build_indexes()
+
+
+    def set_meta(self, meta):
+        self.log_seq = int(meta['log_seq'])
+        if "event_hash" in meta:
+            self.next_ids = {key: int(meta[key]) for key in ["event_hash", "theme_hash", "team_hash"]}
+
+
+    def get_meta(self):
+        return {"log_seq": self.log_seq, **self.next_ids}
+
+
+    def migrate_ids(self):
+        # раньше идентификаторы получались из hash(), который меняется между запусками и дает коллизии
+        # одинаковых названий команд в разных мероприятиях; здесь они заменяются на последовательные номера
+        for name in ["event_df", "theme_df", "team_df", "member_df"]:
+            self._flush(name)
+            self._purge(name)
+        event_ids = {event_hash: new_id for new_id, event_hash in enumerate(self.event_df['event_hash'], start=1)}
+        theme_ids = {key: new_id for new_id, key in enumerate(zip(self.theme_df['event_hash'], self.theme_df['theme_hash']), start=1)}
+        team_ids = {key: new_id for new_id, key in enumerate(zip(self.team_df['event_hash'], self.team_df['team_hash']), start=1)}
+
+        def remap(df, column, ids, keys):
+            # присваивание пустого списка сделало бы столбец float64
+            if len(df):
+                df[column] = [ids[key] for key in keys]
+
+        remap(self.theme_df, 'theme_hash', theme_ids, zip(self.theme_df['event_hash'], self.theme_df['theme_hash']))
+        remap(self.team_df, 'theme_hash', theme_ids, zip(self.team_df['event_hash'], self.team_df['theme_hash']))
+        remap(self.team_df, 'team_hash', team_ids, zip(self.team_df['event_hash'], self.team_df['team_hash']))
+        remap(self.member_df, 'team_hash', team_ids, zip(self.member_df['event_hash'], self.member_df['team_hash']))
+        for df in [self.event_df, self.theme_df, self.team_df, self.member_df]:
+            remap(df, 'event_hash', event_ids, df['event_hash'])
+
+        self.next_ids = {"event_hash": len(event_ids) + 1, "theme_hash": len(theme_ids) + 1, "team_hash": len(team_ids) + 1}
+        self.build_indexes()
+        logger.info("Идентификаторы переведены на последовательные номера: мероприятий %d, тем %d, команд %d",
+                    len(event_ids), len(theme_ids), len(team_ids))
+
+
+    def _allocate_ids(self, key, count=1):
+        # номер выдается под блокировкой и никогда не переиспользуется, даже после удаления
+        with self.lock:
+            start = self.next_ids[key]
+            self.next_ids[key] = start + count
+        return list(range(start, start + count))
+
+
+    def _use_id(self, key, value):
+        # при воспроизведении журнала счетчик продвигается по записанным идентификаторам
+        if self.next_ids is not None:
+            self.next_ids[key] = max(self.next_ids[key], value + 1)
+
+
+    def replay_log(self):
+        # сначала сегмент, оставшийся от незавершенного сохранения, затем текущий журнал
+        for url in [self.log_url + ".old", self.log_url]:
+            if not os.path.exists(url):
+                continue
+            with open(url, encoding="utf-8") as log:
+                for line in log:
+                    if not line.endswith("\n"):
+                        break
+                    record = json.loads(line)
+                    if record['seq'] <= self.log_seq:
+                        continue
+                    # запись, которую нельзя применить, пропускается, иначе бот не запустится никогда
+                    try:
+                        getattr(self, "_op_" + record['op'])(**record['args'])
+                    except Exception:
+                        logger.warning("Запись журнала %d (%s) не применена и пропущена", record['seq'], record['op'], exc_info=True)
+                    else:
+                        self.event_versions[self._op_event_hash(record['args'])] = record['seq']
+                    self.log_seq = record['seq']
+
+
+    def _apply(self, op, **args):
+        with self.lock:
+            # в журнал попадает только успешно примененное изменение
+            result = getattr(self, "_op_" + op)(**args)
+            self.log_seq += 1
+            self.log_file.write(json.dumps({"seq": self.log_seq, "op": op, "args": args},
+                                           ensure_ascii=False, default=lambda value: value.item()) + "\n")
+            self.log_file.flush()
+            os.fsync(self.log_file.fileno())
+            self.event_versions[self._op_event_hash(args)] = self.log_seq
+            return result
+
+
+    @staticmethod
+    def _op_event_hash(args):
+        for key in ["event", "team", "member"]:
+            if key in args:
+                return args[key]['event_hash']
+        return args['event_hash']
+
+
+    def get_event_version(self, event_hash):
+        return self.event_versions.get(event_hash, self.loaded_seq)
+
+
+    def get_table_sizes(self):
+        # строки в буферах вставки еще не попали в таблицы, но уже являются данными
+        with self.lock:
+            return {name[:-3]: len(getattr(self, name)) + len(self.buffers[name]) - len(self.dropped[name])
+                    for name in ["event_df", "theme_df", "team_df", "member_df"]}
+
+
+    def build_indexes(self):
+        # event_hash -> метка строки в event_df
+        self.event_rows = {}
+        # (event_hash, theme_hash) -> метка строки в theme_df, event_hash -> темы мероприятия в порядке добавления
+        self.theme_rows = {}
+        self.event_themes = {}
+        # (event_hash, team_hash) -> метка строки в team_df, event_hash/(event_hash, theme_hash) -> команды
+        self.team_rows = {}
+        self.event_teams = {}
+        self.theme_teams = {}
+        # (event_hash, team_hash) -> {member_id: метка}, member_id -> {(event_hash, team_hash): метка}
+        self.team_members = {}
+        self.member_rows = {}
+        # (member_id, event_hash) -> team_hash команды, в которую участник принят
+        self.accepted_in = {}
+        # счетчики, обновляемые при каждом изменении: (event_hash, team_hash) -> число принятых участников,
+        # event_hash -> открытые и незаполненные команды, (event_hash, theme_hash) -> число таких команд в теме,
+        # event_hash -> темы, в которых еще можно создать команду
+        self.team_accepted = {}
+        self.open_teams = {}
+        self.theme_open_teams = {}
+        self.themes_to_create = {}
+
+        self.next_label = {}
+        # метка -> запись для строк, еще не перенесенных в DataFrame
+        self.buffers = {}
+        # метки удаленных строк, которые еще остаются в DataFrame
+        self.dropped = {}
+        for name in ["event_df", "theme_df", "team_df", "member_df"]:
+            df = getattr(self, name)
+            df.index = pd.RangeIndex(len(df))
+            self.next_label[name] = len(df)
+            self.buffers[name] = {}
+            self.dropped[name] = set()
+
+        for label, event_hash in zip(self.event_df.index, self.event_df['event_hash']):
+            self.event_rows[event_hash] = label
+        for label, event_hash, theme_hash in zip(self.theme_df.index, self.theme_df['event_hash'], self.theme_df['theme_hash']):
+            self._index_theme(label, event_hash, theme_hash)
+        for label, event_hash, theme_hash, team_hash in zip(self.team_df.index, self.team_df['event_hash'],
+                                                             self.team_df['theme_hash'], self.team_df['team_hash']):
+            self._index_team(label, event_hash, theme_hash, team_hash)
+        for label, member_id, event_hash, team_hash, accepted in zip(self.member_df.index, self.member_df['member_id'],
+                                                                     self.member_df['event_hash'], self.member_df['team_hash'],
+                                                                     self.member_df['accepted']):
+            self._index_member(label, member_id, event_hash, team_hash, accepted)
+
+        for event_hash, team_hash in self.team_rows:
+            self._refresh_team(event_hash, team_hash)
+        for event_hash, theme_hash in self.theme_rows:
+            self._refresh_theme(event_hash, theme_hash)
+
+
+    def _refresh_team(self, event_hash, team_hash):
+        label = self.team_rows[(event_hash, team_hash)]
+        is_open = (self._get("team_df", label, 'team_opened') == True and
+                   self.team_accepted.get((event_hash, team_hash), 0) < self.get_max_members(event_hash))
+        open_teams = self.open_teams.setdefault(event_hash, {})
+        if is_open and team_hash not in open_teams:
+            open_teams[team_hash] = None
+            theme_key = (event_hash, self._get("team_df", label, 'theme_hash'))
+            self.theme_open_teams[theme_key] = self.theme_open_teams.get(theme_key, 0) + 1
+        elif not is_open and team_hash in open_teams:
+            self._close_team(event_hash, team_hash)
+
+
+    def _close_team(self, event_hash, team_hash):
+        del self.open_teams[event_hash][team_hash]
+        theme_key = (event_hash, self._get("team_df", self.team_rows[(event_hash, team_hash)], 'theme_hash'))
+        self.theme_open_teams[theme_key] -= 1
+        if not self.theme_open_teams[theme_key]:
+            del self.theme_open_teams[theme_key]
+
+
+    def _refresh_theme(self, event_hash, theme_hash):
+        themes = self.themes_to_create.setdefault(event_hash, {})
+        max_teams = self._get("theme_df", self.theme_rows[(event_hash, theme_hash)], 'max_teams')
+        if len(self.theme_teams.get((event_hash, theme_hash), {})) < max_teams:
+            themes[theme_hash] = None
+        else:
+            themes.pop(theme_hash, None)
+
+
+    def _index_theme(self, label, event_hash, theme_hash):
+        self.theme_rows[(event_hash, theme_hash)] = label
+        self.event_themes.setdefault(event_hash, {})[theme_hash] = None
+
+
+    def _index_team(self, label, event_hash, theme_hash, team_hash):
+        self.team_rows[(event_hash, team_hash)] = label
+        self.event_teams.setdefault(event_hash, {})[team_hash] = None
+        self.theme_teams.setdefault((event_hash, theme_hash), {})[team_hash] = None
+
+
+    def _index_member(self, label, member_id, event_hash, team_hash, accepted):
+        self.team_members.setdefault((event_hash, team_hash), {})[member_id] = label
+        self.member_rows.setdefault(member_id, {})[(event_hash, team_hash)] = label
+        if accepted:
+            self.accepted_in[(member_id, event_hash)] = team_hash
+            self.team_accepted[(event_hash, team_hash)] = self.team_accepted.get((event_hash, team_hash), 0) + 1
+
+
+    def _unindex_member(self, member_id, event_hash, team_hash):
+        label = self.team_members[(event_hash, team_hash)].pop(member_id)
+        if not self.team_members[(event_hash, team_hash)]:
+            del self.team_members[(event_hash, team_hash)]
+        del self.member_rows[member_id][(event_hash, team_hash)]
+        if not self.member_rows[member_id]:
+            del self.member_rows[member_id]
+        if self.accepted_in.get((member_id, event_hash)) == team_hash:
+            del self.accepted_in[(member_id, event_hash)]
+            self.team_accepted[(event_hash, team_hash)] -= 1
+        return label
+
+
+    def _append(self, name, records):
+        start = self.next_label[name]
+        self.next_label[name] = start + len(records)
+        labels = list(range(start, start + len(records)))
+        buffer = self.buffers[name]
+        for label, record in zip(labels, records):
+            buffer[label] = dict(record)
+        if len(buffer) >= max(INSERT_BATCH, len(getattr(self, name)) // BATCH_RATIO):
+            self._flush(name)
+        return labels
+
+
+    def _merged(self, name):
+        # таблица вместе с буфером вставки, сами они не меняются
+        buffer = self.buffers[name]
+        df = getattr(self, name).copy(deep=False)
+        if not buffer:
+            return df
+        chunk = pd.DataFrame.from_records(list(buffer.values()), index=list(buffer))
+        # новые строки приводятся к типам таблицы, иначе pd.concat вернет столбцы object/int64
+        for column in COMPACT_DTYPES[name]:
+            if column not in df.columns or column not in chunk.columns:
+                continue
+            if isinstance(df[column].dtype, pd.CategoricalDtype):
+                new_values = pd.Index(chunk[column].dropna().unique()).difference(df[column].cat.categories)
+                if len(new_values):
+                    df[column] = df[column].cat.add_categories(new_values)
+                chunk[column] = pd.Categorical(chunk[column], categories=df[column].cat.categories)
+            else:
+                chunk[column] = chunk[column].astype(df[column].dtype)
+        return pd.concat([df, chunk])
+
+
+    def _flush(self, name):
+        if not self.buffers[name]:
+            return
+        # сначала подменяется таблица, затем очищается буфер: параллельное чтение видит строку хотя бы в одном из них
+        setattr(self, name, self._merged(name))
+        self.buffers[name].clear()
+
+
+    def _purge(self, name):
+        dropped = self.dropped[name]
+        if not dropped:
+            return
+        # новая таблица вместо drop(inplace=True): читающие потоки дочитывают старую
+        setattr(self, name, getattr(self, name).drop(index=list(dropped)))
+        dropped.clear()
+
+
+    def compact(self):
+        # после загрузки и перевода идентификаторов на последовательные номера, которые помещаются в int32
+        with self.lock:
+            for name, dtypes in COMPACT_DTYPES.items():
+                self._flush(name)
+                self._purge(name)
+                df = getattr(self, name)
+                setattr(self, name, df.astype({column: dtype for column, dtype in dtypes.items() if column in df.columns}))
+
+
+    def memory_report(self):
+        with self.lock:
+            frames = {name[:-3]: (getattr(self, name), len(self.buffers[name]) - len(self.dropped[name])) for name in COMPACT_DTYPES}
+        tables = {}
+        for table, (df, pending) in frames.items():
+            usage = df.memory_usage(deep=True)
+            tables[table] = {"rows": len(df) + pending, "bytes": int(usage.sum()),
+                             "columns": {column: {"dtype": str(df[column].dtype), "bytes": int(usage[column])}
+                                         for column in df.columns}}
+        return {"backend": "xlsx", "tables": tables, "total_bytes": sum(table['bytes'] for table in tables.values())}
+
+
+    def _get(self, name, label, column):
+        record = self.buffers[name].get(label)
+        if record is not None:
+            return record[column]
+        return getattr(self, name).at[label, column]
+
+
+    def _set(self, name, label, column, value):
+        record = self.buffers[name].get(label)
+        if record is not None:
+            record[column] = value
+        else:
+            getattr(self, name).at[label, column] = value
+
+
+    def _records(self, name, labels, columns=None):
+        # буфер читается раньше таблицы, как в _get: строка, которой уже нет в буфере, есть в таблице, прочитанной после него
+        buffer = self.buffers[name]
+        buffered = [(label, buffer.get(label)) for label in labels]
+        df = getattr(self, name)
+        columns = columns or list(df.columns)
+        frame_labels = [label for label, record in buffered if record is None]
+        rows = dict(zip(frame_labels, df.loc[frame_labels, columns].to_dict('records')))
+        return [rows[label] if record is None else {column: record[column] for column in columns} for label, record in buffered]
+
+
+    def _drop(self, name, labels):
+        # строка из буфера удаляется сразу, строка таблицы только помечается; индексы на нее больше не ссылаются
+        buffer = self.buffers[name]
+        dropped = self.dropped[name]
+        dropped.update(label for label in labels if buffer.pop(label, None) is None)
+        if len(dropped) >= max(INSERT_BATCH, len(getattr(self, name)) // BATCH_RATIO):
+            self._purge(name)
+
+
+    def _is_participant(self, member_id, event_hash):
+        return (member_id, event_hash) in self.accepted_in
 
 
     def is_event_name_unique(self, name: str):
-        return not (name in self.event_df['event'].to_list())
+        return not (name in [event['event'] for event in self.get_events()])
 
 
     @staticmethod
@@ -39,107 +462,92 @@ class Reader:
 
 
     def add_event_theme(self, event_name, org_id, alias, max_members, file_url):
-        df = pd.read_excel(file_url)
-        event_hash = hash(event_name)
-        add_event_df = pd.DataFrame.from_records([{
+        errors, themes = read_themes(file_url)
+        os.remove(file_url)
+        if errors:
+            return errors
+        # ошибка возвращается списком, как ошибки файла, иначе пустой список приняли бы за успех
+        if self.add_event(event_name, org_id, alias, max_members, themes) == 1:
+            return ["К сожалению, уже появилось мероприятие с таким названием. Напишите другое название."]
+        return errors
+
+
+    def add_event(self, event_name, org_id, alias, max_members, themes):
+        # название могло быть занято, пока файл с темами загружался и проверялся
+        if not self.is_event_name_unique(event_name):
+            return 1
+
+        [event_hash] = self._allocate_ids("event_hash")
+        for theme, theme_hash in zip(themes, self._allocate_ids("theme_hash", len(themes))):
+            theme['event_hash'] = event_hash
+            theme['theme_hash'] = theme_hash
+        self._apply("add_event", event={
             "event": event_name,
             "organizer_id": org_id,
             "alias": alias,
             "max_members": max_members,
             "event_hash": event_hash
-        }])
+        }, themes=themes)
 
-        errors = []
-        theme = []
 
-        if df.empty:
-            errors.append(f"В файле отсутствуют данные.")
-            os.remove(file_url)
-            return errors
+    def _op_add_event(self, event, themes):
+        [label] = self._append("event_df", [event])
+        self.event_rows[event['event_hash']] = label
+        self._use_id("event_hash", event['event_hash'])
 
-        # проверка наличия заголовков
-        for col_name in ['theme', 'company', 'max_teams','responsible', 'email', 'description', 'background', 'problem', 'expected_result']:
-            if col_name not in df.columns:
-                errors.append(f"Отстуствует заголовок {col_name}.")
-        if errors:
-            os.remove(file_url)
-            return errors
-
-        for index, row in df.iterrows():
-            if not self.is_digit(str(row['max_teams'])):
-                errors.append(f"Ошибка в строке {index+2}: значение не является числом.\n    {row['max_teams']}")
-                continue
-            if len(df[df['theme'] == row['theme']]) != 1:
-                errors.append(f"Ошибка в строке {index+2}: найден дубликат.\n    {row['theme']}")
-                continue
-            theme.append(row)
-        if not errors:
-            self.event_df = pd.concat([
-                self.event_df,
-                add_event_df
-            ], ignore_index=True)
-            self.event_df['event_hash'] = self.event_df['event_hash'].apply(pd.to_numeric)
-
-            add_theme_df = pd.DataFrame.from_records(theme)
-            add_theme_df['event_hash'] = event_hash
-            add_theme_df['theme_hash'] = add_theme_df['theme'].apply(hash)
-            self.theme_df = pd.concat([
-                self.theme_df,
-                add_theme_df
-            ], ignore_index=True)
-            self.theme_df[['event_hash', 'theme_hash']] = self.theme_df[['event_hash', 'theme_hash']].apply(pd.to_numeric)
-        os.remove(file_url)
-        return errors
+        labels = self._append("theme_df", themes)
+        for label, theme in zip(labels, themes):
+            self._index_theme(label, event['event_hash'], theme['theme_hash'])
+            self._use_id("theme_hash", theme['theme_hash'])
+            self._refresh_theme(event['event_hash'], theme['theme_hash'])
 
 
     def get_events(self):
-        return self.event_df[["event", "event_hash"]].to_dict('records')
+        return self._records("event_df", sorted(self.event_rows.values()), ["event", "event_hash"])
 
 
     def get_event_name(self, event_hash):
-        return self.event_df[self.event_df['event_hash']==event_hash]['event'].iloc[0]
+        return self._get("event_df", self.event_rows[event_hash], 'event')
 
 
     def get_themes_to_create(self, leader_id, event_hash):
-        if not self.member_df[
-            (self.member_df['member_id'] == leader_id) & (self.member_df["event_hash"] == event_hash) & (self.member_df['accepted'])
-        ].empty:
+        if self._is_participant(leader_id, event_hash):
             return 1
-        teams_on_theme_count = self.team_df[self.team_df["event_hash"] == event_hash]["theme_hash"].value_counts()
-        themes_of_event_df = self.theme_df[self.theme_df["event_hash"] == event_hash]
-        teams_in_themes = pd.merge(themes_of_event_df, teams_on_theme_count, how='outer', left_on='theme_hash', right_on='theme_hash').fillna(0)
-        return teams_in_themes[teams_in_themes["max_teams"] > teams_in_themes["count"]][["theme", "theme_hash"]].to_dict('records')
+        available = self.themes_to_create.get(event_hash, {})
+        return [{"theme": self.get_theme_name(event_hash, theme_hash), "theme_hash": theme_hash}
+                for theme_hash in self.event_themes.get(event_hash, {}) if theme_hash in available]
 
     
     def theme_info(self, event_hash, theme_hash):
-        row = self.theme_df[(self.theme_df["event_hash"] == event_hash) & (self.theme_df["theme_hash"] == theme_hash)].copy()
-        row.rename(columns={"event_hash": "event"}, inplace=True)
-        row['event'] = self.get_event_name(event_hash)
-        return row.replace({nan: None}).to_dict('records')[0]
+        label = self.theme_rows.get((event_hash, theme_hash))
+        if label is None:
+            return None
+        row = self._records("theme_df", [label], THEME_COLUMNS + ['theme_hash'])[0]
+        row = {"event": self.get_event_name(event_hash), **row}
+        return {key: None if value != value else value for key, value in row.items()}
     
 
     def is_create_theme_available(self, leader_id, event_hash, theme_hash):
-        if not self.member_df[
-            (self.member_df['member_id'] == leader_id) & (self.member_df["event_hash"] == event_hash) & (self.member_df['accepted'])
-        ].empty:
+        if self._is_participant(leader_id, event_hash):
             return False
-        teams_count = len(self.team_df[(self.team_df["event_hash"] == event_hash) & (self.team_df["theme_hash"] == theme_hash)])
-        max_teams = self.theme_df[(self.theme_df["event_hash"] == event_hash) & (self.theme_df["theme_hash"] == theme_hash)].iloc[0, 3]
-
-        return teams_count < max_teams
+        return theme_hash in self.themes_to_create.get(event_hash, {})
     
 
     def get_theme_name(self, event_hash, theme_hash):
-        return self.theme_df[(self.theme_df['event_hash']==event_hash) & (self.theme_df['theme_hash']==theme_hash)]['theme'].iloc[0]
+        return self._get("theme_df", self.theme_rows[(event_hash, theme_hash)], 'theme')
 
 
     def is_team_name_unique(self, event_hash, team_name):
-        return self.team_df[(self.team_df['event_hash'] == event_hash) & (self.team_df['team_name'] == team_name)].empty
+        return team_name not in [self._get("team_df", self.team_rows[(event_hash, team_hash)], 'team_name')
+                                 for team_hash in self.event_teams.get(event_hash, {})]
 
 
     def add_team(self, event_hash, theme_hash, team_name, leader_id, l_alias, description):
-        team_hash = hash(team_name)
-        add_team_df = pd.DataFrame.from_records([{
+        # тема могла быть удалена вместе с мероприятием, пока лидер заполнял данные команды
+        if (event_hash, theme_hash) not in self.theme_rows:
+            return
+        [team_hash] = self._allocate_ids("team_hash")
+        self._apply("add_team", team={
             "event_hash": event_hash,
             "theme_hash": theme_hash,
             "team_name": team_name,
@@ -148,229 +556,330 @@ class Reader:
             "team_opened": True,
             "team_needs": description,
             "team_hash": team_hash
-        }])
+        })
 
-        self.team_df = pd.concat([
-            self.team_df,
-            add_team_df
-        ], ignore_index=True)
 
-        add_member_df = pd.DataFrame.from_records([{
-            "member_id": leader_id,
-            "alias": l_alias,
-            "event_hash": event_hash,
-            "team_hash": team_hash,
-            "accepted": True
-        }])
+    def _op_add_team(self, team):
+        [label] = self._append("team_df", [team])
+        self._index_team(label, team['event_hash'], team['theme_hash'], team['team_hash'])
+        self._use_id("team_hash", team['team_hash'])
 
-        self.member_df = pd.concat([
-            self.member_df,
-            add_member_df
-        ], ignore_index=True)
+        self._op_add_member({
+            "member_id": team['leader_id'],
+            "alias": team['leader_alias'],
+            "event_hash": team['event_hash'],
+            "team_hash": team['team_hash'],
+            "accepted": True
+        })
+        self._refresh_team(team['event_hash'], team['team_hash'])
+        self._refresh_theme(team['event_hash'], team['theme_hash'])
 
 
     def get_themes_to_join(self, member_id, event_hash):
-        if not self.member_df[
-            (self.member_df['member_id'] == member_id) & (self.member_df["event_hash"] == event_hash) & (self.member_df['accepted'] == True)
-        ].empty:
+        if self._is_participant(member_id, event_hash):
             return 1
 
-        teams_with_member = self.member_df[(self.member_df["member_id"] == member_id)]["team_hash"].tolist()
-        max_members = self.event_df[self.event_df['event_hash'] == event_hash].iloc[0, 3]
-        members_in_team_count = self.member_df[(self.member_df["event_hash"] == event_hash) &
-                                               (self.member_df["accepted"] == True)]["team_hash"].value_counts()
-        team_hashes = members_in_team_count[members_in_team_count < max_members].index.tolist()
-        teams_to_join = self.team_df[(self.team_df['team_opened'] == True) & 
-                                     (self.team_df['team_hash'].isin(team_hashes)) &
-                                     (~self.team_df['team_hash'].isin(teams_with_member))]
-        themes_to_join = self.theme_df[self.theme_df["theme_hash"].isin(teams_to_join['theme_hash'])]
-        return themes_to_join[["theme", "theme_hash"]].to_dict('records')
+        # открытые команды темы, кроме тех, куда пользователь уже отправил запрос
+        open_teams = self.open_teams.get(event_hash, {})
+        own_teams = {}
+        for (m_event_hash, team_hash) in self.member_rows.get(member_id, {}):
+            if m_event_hash == event_hash and team_hash in open_teams:
+                theme_hash = self._get("team_df", self.team_rows[(event_hash, team_hash)], 'theme_hash')
+                own_teams[theme_hash] = own_teams.get(theme_hash, 0) + 1
+        return [{"theme": self.get_theme_name(event_hash, theme_hash), "theme_hash": theme_hash}
+                for theme_hash in self.event_themes.get(event_hash, {})
+                if self.theme_open_teams.get((event_hash, theme_hash), 0) > own_teams.get(theme_hash, 0)]
     
 
+    def get_theme_options(self, member_id, event_hash, theme_hash):
+        if self._is_participant(member_id, event_hash):
+            return 1
+
+        open_teams = self.open_teams.get(event_hash, {})
+        own_teams = sum(1 for (m_event_hash, team_hash) in self.member_rows.get(member_id, {})
+                        if m_event_hash == event_hash and team_hash in open_teams and
+                        self._get("team_df", self.team_rows[(event_hash, team_hash)], 'theme_hash') == theme_hash)
+        return {"join": self.theme_open_teams.get((event_hash, theme_hash), 0) > own_teams,
+                "create": theme_hash in self.themes_to_create.get(event_hash, {})}
+
+
     def get_teams_to_join(self, leader_id, event_hash, theme_hash):
-        if not self.member_df[
-            (self.member_df['member_id'] == leader_id) & (self.member_df["event_hash"] == event_hash) & (self.member_df['accepted'])
-        ].empty:
+        if self._is_participant(leader_id, event_hash):
             return 1
         
-        max_members = self.event_df[self.event_df['event_hash'] == event_hash].iloc[0, 3]
-        members_in_team_count = self.member_df[self.member_df["event_hash"] == event_hash]["team_hash"].value_counts()
-        team_hashes = members_in_team_count[members_in_team_count < max_members].index.tolist()
-        teams_to_join = self.team_df[(self.team_df['event_hash'] == event_hash) &
-                                     (self.team_df['theme_hash'] == theme_hash) & 
-                                     (self.team_df['team_opened'] == True) & 
-                                     (self.team_df['team_hash'].isin(team_hashes))]
-
-        return teams_to_join[['team_name', 'team_hash']].to_dict('records')
+        max_members = self.get_max_members(event_hash)
+        open_teams = self.open_teams.get(event_hash, {})
+        return [{"team_name": self.get_team_name(event_hash, team_hash), "team_hash": team_hash}
+                for team_hash in self.theme_teams.get((event_hash, theme_hash), {})
+                if team_hash in open_teams and len(self.team_members.get((event_hash, team_hash), {})) < max_members]
 
 
     def get_team_description(self, event_hash, team_hash):
-        return self.team_df[(self.team_df["event_hash"] == event_hash) & 
-                            (self.team_df['team_hash'] == team_hash)].to_dict("records")[0]['team_needs']
+        return self._get("team_df", self.team_rows[(event_hash, team_hash)], 'team_needs')
     
 
     def get_team_name(self, event_hash, team_hash):
-        return self.team_df[(self.team_df["event_hash"] == event_hash) & 
-                            (self.team_df['team_hash'] == team_hash)].to_dict("records")[0]['team_name']
+        return self._get("team_df", self.team_rows[(event_hash, team_hash)], 'team_name')
 
 
     def add_member_to_team(self, member_id, member_alias, event_hash, team_hash):
-        if not self.member_df[
-            (self.member_df['member_id'] == member_id) & (self.member_df["event_hash"] == event_hash) & (self.member_df['accepted'] == True)
-        ].empty:
+        if self._is_participant(member_id, event_hash):
             return 1
         
-        max_members = self.event_df[self.event_df['event_hash'] == event_hash].iloc[0, 3]
-        if ((self.team_df[(self.team_df['team_hash'] == team_hash) & 
-                          (self.member_df['event_hash'] == event_hash)].iloc[0, 5] == False) or 
-            (len(self.member_df[(self.member_df['team_hash'] == team_hash) & 
-                                (self.member_df['accepted'] == True) &
-                                (self.member_df['event_hash'] == event_hash)]) >= max_members)):
+        if team_hash not in self.open_teams.get(event_hash, {}):
             return 2
 
-        add_member_df = pd.DataFrame.from_records([{
-            "member_id": member_id,
-            "alias": member_alias,
-            "event_hash": event_hash,
-            "team_hash": team_hash,
-            "accepted": False
-        }])
-        
-        self.member_df = pd.concat([
-            self.member_df,
-            add_member_df
-        ], ignore_index=True)
+        if (event_hash, team_hash) not in self.member_rows.get(member_id, {}):
+            self._apply("add_member", member={
+                "member_id": member_id,
+                "alias": member_alias,
+                "event_hash": event_hash,
+                "team_hash": team_hash,
+                "accepted": False
+            })
 
-        leader_data = self.team_df[(self.team_df['team_hash'] == team_hash) & (self.team_df['event_hash'] == event_hash)].to_dict("records")[0]
+        leader_data = self._records("team_df", [self.team_rows[(event_hash, team_hash)]])[0]
         return {"leader_id": leader_data["leader_id"], "leader_alias": leader_data['leader_alias'], "team_name": leader_data['team_name']}
 
 
+    def _op_add_member(self, member):
+        [label] = self._append("member_df", [member])
+        self._index_member(label, member['member_id'], member['event_hash'], member['team_hash'], member['accepted'])
+
+
     def get_member_events(self, member_id):
-        rows_with_member = self.member_df[(self.member_df['member_id'] == member_id) & (self.member_df['accepted'] == True)]
-        return self.event_df[self.event_df['event_hash']
-                             .isin(rows_with_member['event_hash'])][['event', 'event_hash']].to_dict('records')
+        labels = sorted(self.event_rows[event_hash] for (event_hash, team_hash) in self.member_rows.get(member_id, {})
+                        if self.accepted_in.get((member_id, event_hash)) == team_hash)
+        return self._records("event_df", labels, ['event', 'event_hash'])
     
 
     def get_team_info(self, member_id, event_hash):
-        team_hash = self.member_df[(self.member_df['member_id'] == member_id) & 
-                                   (self.member_df['accepted'] == True) &
-                                   (self.member_df['event_hash'] == event_hash)].iloc[0, 3]
-        return self.team_df[(self.team_df['team_hash'] == team_hash) & (self.team_df['event_hash'] == event_hash)].to_dict('records')[0]
+        team_hash = self.accepted_in.get((member_id, event_hash))
+        if team_hash is None:
+            return None
+        return self._records("team_df", [self.team_rows[(event_hash, team_hash)]], TEAM_COLUMNS)[0]
     
 
+    def get_team_dashboard(self, member_id, event_hash):
+        # все данные экрана команды собираются по индексам без выборок из таблиц
+        team_hash = self.accepted_in.get((member_id, event_hash))
+        if team_hash is None:
+            return None
+        label = self.team_rows[(event_hash, team_hash)]
+        dashboard = {"event": self.get_event_name(event_hash),
+                     "theme": self.get_theme_name(event_hash, self._get("team_df", label, 'theme_hash')),
+                     "team_hash": team_hash}
+        for column in ['team_name', 'leader_id', 'leader_alias', 'team_opened', 'team_needs']:
+            dashboard[column] = self._get("team_df", label, column)
+        dashboard['members'] = self.get_current_members(event_hash, team_hash)
+        dashboard['max_members'] = self.get_max_members(event_hash)
+        return dashboard
+
+
     def get_max_members(self, event_hash):
-        return self.event_df[self.event_df['event_hash'] == event_hash].to_dict("records")[0]['max_members']
+        return self._get("event_df", self.event_rows[event_hash], 'max_members')
     
 
     def get_current_members(self, event_hash, team_hash):
-        return len(self.member_df[(self.member_df['event_hash'] == event_hash) & 
-                                  (self.member_df['team_hash'] == team_hash) &
-                                  (self.member_df['accepted'] == True)])
+        return self.team_accepted.get((event_hash, team_hash), 0)
 
 
     def get_not_accepted_members(self, event_hash, team_hash):
-        not_accepted = self.member_df[(self.member_df['event_hash'] == event_hash) &
-                                      (self.member_df['team_hash'] == team_hash) & 
-                                      (self.member_df['accepted'] == False)]
-        return not_accepted[['member_id', 'alias']].to_dict("records")
+        labels = [label for member_id, label in self.team_members.get((event_hash, team_hash), {}).items()
+                  if self.accepted_in.get((member_id, event_hash)) != team_hash]
+        return self._records("member_df", labels, ['member_id', 'alias'])
     
 
     def get_user_alias(self, member_id):
-        return self.member_df[(self.member_df['member_id'] == member_id)].iloc[0, 1]
+        return self._get("member_df", next(iter(self.member_rows[member_id].values())), 'alias')
 
 
     def accept_member(self, event_hash, team_hash, member_id):
+        # участник, уже принятый в команду этого мероприятия (в том числе лидер своей команды), повторно не принимается
+        if (event_hash, team_hash) not in self.team_rows or self._is_participant(member_id, event_hash):
+            return 2
         max_members = self.get_max_members(event_hash)
         cur_members = self.get_current_members(event_hash, team_hash)
         if max_members == cur_members:
             return 1
 
-        condition = (self.member_df['event_hash'] == event_hash) & (self.member_df['team_hash'] == team_hash) & (self.member_df['member_id'] == member_id)
-
-        if len(self.member_df[condition]) == 0:
+        if member_id not in self.team_members.get((event_hash, team_hash), {}):
             return 2
 
-        self.member_df.loc[condition, 'accepted'] = True
-
-        rows_to_delete = self.member_df[(self.member_df['event_hash'] == event_hash) & 
-                (self.member_df['member_id'] == member_id) &
-                (self.member_df['accepted'] == False)].index
-        self.member_df.drop(index=rows_to_delete, inplace=True)
+        self._apply("accept_member", event_hash=event_hash, team_hash=team_hash, member_id=member_id)
 
         return [max_members, cur_members+1]
 
 
+    def _op_accept_member(self, event_hash, team_hash, member_id):
+        # повторный прием (например, из журнала прежних версий) не меняет данные и счетчик принятых
+        if self._is_participant(member_id, event_hash):
+            return
+        # удаляются только остальные непринятые запросы участника в этом мероприятии
+        rows_to_delete = []
+        for (m_event_hash, m_team_hash) in list(self.member_rows[member_id]):
+            if m_event_hash == event_hash and m_team_hash != team_hash:
+                rows_to_delete.append(self._unindex_member(member_id, m_event_hash, m_team_hash))
+                self._refresh_team(m_event_hash, m_team_hash)
+        self._drop("member_df", rows_to_delete)
+
+        self._set("member_df", self.team_members[(event_hash, team_hash)][member_id], 'accepted', True)
+        self.accepted_in[(member_id, event_hash)] = team_hash
+        self.team_accepted[(event_hash, team_hash)] = self.team_accepted.get((event_hash, team_hash), 0) + 1
+        self._refresh_team(event_hash, team_hash)
+
+
     def remove_member(self, event_hash, team_hash, member_id):
-        rows_to_delete = self.member_df[(self.member_df['event_hash'] == event_hash) & 
-                (self.member_df['team_hash'] == team_hash) &
-                (self.member_df['member_id'] == member_id)].index
-        self.member_df.drop(index=rows_to_delete, inplace=True)
+        if member_id not in self.team_members.get((event_hash, team_hash), {}):
+            return
+        self._apply("remove_member", event_hash=event_hash, team_hash=team_hash, member_id=member_id)
+
+
+    def _op_remove_member(self, event_hash, team_hash, member_id):
+        self._drop("member_df", [self._unindex_member(member_id, event_hash, team_hash)])
+        self._refresh_team(event_hash, team_hash)
 
 
     def flip_team_opened(self, event_hash, team_hash):
-        condition = (self.team_df['event_hash'] == event_hash) & (self.team_df['team_hash'] == team_hash)
-        self.team_df.loc[condition, 'team_opened'] = not self.team_df.loc[condition, 'team_opened'].iloc[0]
+        if (event_hash, team_hash) not in self.team_rows:
+            return
+        team_opened = self._get("team_df", self.team_rows[(event_hash, team_hash)], 'team_opened')
+        self._apply("set_team_opened", event_hash=event_hash, team_hash=team_hash, team_opened=not team_opened)
+
+
+    def _op_set_team_opened(self, event_hash, team_hash, team_opened):
+        self._set("team_df", self.team_rows[(event_hash, team_hash)], 'team_opened', team_opened)
+        self._refresh_team(event_hash, team_hash)
 
 
     def get_team_members(self, leader_id, event_hash, team_hash):
-        return self.member_df[(self.member_df['event_hash'] == event_hash) &
-                              (self.member_df['team_hash'] == team_hash) &
-                              (self.member_df['accepted'] == True) &
-                              (self.member_df['member_id'] != leader_id)][['member_id', 'alias']].to_dict('records')
+        labels = [label for member_id, label in self.team_members.get((event_hash, team_hash), {}).items()
+                  if member_id != leader_id and self.accepted_in.get((member_id, event_hash)) == team_hash]
+        return self._records("member_df", labels, ['member_id', 'alias'])
     
 
     def change_team_needs(self, event_hash, team_hash, description):
-        self.team_df.loc[(self.team_df['event_hash'] == event_hash) &
-                              (self.team_df['team_hash'] == team_hash), 'team_needs'] = description
-        
+        if (event_hash, team_hash) not in self.team_rows:
+            return
+        self._apply("change_team_needs", event_hash=event_hash, team_hash=team_hash, description=description)
 
-    def delete_team(self, event_hash, team_hash, leader_id):
-        members_deleted = self.member_df[(self.member_df['event_hash'] == event_hash) &
-                              (self.member_df['team_hash'] == team_hash) &
-                              (self.member_df['accepted'] == True) &
-                              (self.member_df['member_id'] != leader_id)]['member_id'].to_list()
+
+    def _op_change_team_needs(self, event_hash, team_hash, description):
+        self._set("team_df", self.team_rows[(event_hash, team_hash)], 'team_needs', description)
         
-        rows_to_delete = self.member_df[(self.member_df['event_hash'] == event_hash) & 
-                (self.member_df['team_hash'] == team_hash)].index
-        self.member_df.drop(index=rows_to_delete, inplace=True)
 
-        team_row = self.team_df[(self.team_df['event_hash'] == event_hash) & 
-                (self.team_df['team_hash'] == team_hash)].index
-        self.team_df.drop(index=team_row, inplace=True)
+    def delete_team(self, event_hash, team_hash, leader_id):
+        if (event_hash, team_hash) not in self.team_rows:
+            return []
+        members = self.team_members.get((event_hash, team_hash), {})
+        members_deleted = [member_id for member_id in members
+                           if member_id != leader_id and self.accepted_in.get((member_id, event_hash)) == team_hash]
+        self._apply("delete_team", event_hash=event_hash, team_hash=team_hash)
 
         return members_deleted
+
+
+    def _op_delete_team(self, event_hash, team_hash):
+        members = self.team_members.get((event_hash, team_hash), {})
+        rows_to_delete = [self._unindex_member(member_id, event_hash, team_hash) for member_id in list(members)]
+        self._drop("member_df", rows_to_delete)
+
+        self._drop("team_df", [self._unindex_team(event_hash, team_hash)])
     
 
+    def _unindex_team(self, event_hash, team_hash):
+        if team_hash in self.open_teams.get(event_hash, {}):
+            self._close_team(event_hash, team_hash)
+        self.team_accepted.pop((event_hash, team_hash), None)
+        label = self.team_rows.pop((event_hash, team_hash))
+        theme_hash = self._get("team_df", label, 'theme_hash')
+        del self.event_teams[event_hash][team_hash]
+        del self.theme_teams[(event_hash, theme_hash)][team_hash]
+        if not self.theme_teams[(event_hash, theme_hash)]:
+            del self.theme_teams[(event_hash, theme_hash)]
+        self._refresh_theme(event_hash, theme_hash)
+        return label
+
+
     def get_leader_id(self, event_hash, team_hash):
-        return self.team_df.loc[(self.team_df['event_hash'] == event_hash) & 
-                (self.team_df['team_hash'] == team_hash), 'leader_id'].iloc[0]
+        return self._get("team_df", self.team_rows[(event_hash, team_hash)], 'leader_id')
     
 
     def get_all_themes(self, event_hash):
-        return self.theme_df[self.theme_df['event_hash'] == event_hash][["theme", "theme_hash"]].to_dict('records')
+        labels = [self.theme_rows[(event_hash, theme_hash)] for theme_hash in self.event_themes.get(event_hash, {})]
+        return self._records("theme_df", labels, ["theme", "theme_hash"])
     
 
     def get_user_events(self, organizer_id):
-        return self.event_df[self.event_df['organizer_id'] == organizer_id][["event", "event_hash"]].to_dict('records')
+        return [{"event": event['event'], "event_hash": event['event_hash']}
+                for event in self._records("event_df", sorted(self.event_rows.values()), ["event", "event_hash", "organizer_id"])
+                if event['organizer_id'] == organizer_id]
 
 
     def delete_event(self, event_hash):
-        members_to_delete = self.member_df[(self.member_df['event_hash'] == event_hash)].index
-        self.member_df.drop(index=members_to_delete, inplace=True)
-
-        teams_to_delete = self.team_df[(self.team_df['event_hash'] == event_hash)].index
-        self.team_df.drop(index=teams_to_delete, inplace=True)
-
-        themes_to_delete = self.theme_df[(self.theme_df['event_hash'] == event_hash)].index
-        self.theme_df.drop(index=themes_to_delete, inplace=True)
-
-        event_to_delete = self.event_df[(self.event_df['event_hash'] == event_hash)].index
-        self.event_df.drop(index=event_to_delete, inplace=True)
+        if event_hash not in self.event_rows:
+            return []
+        return self._apply("delete_event", event_hash=event_hash)
+
+
+    def _op_delete_event(self, event_hash):
+        members_to_delete = []
+        members_deleted = {}
+        for team_hash in list(self.event_teams.get(event_hash, {})):
+            for member_id in list(self.team_members.get((event_hash, team_hash), {})):
+                members_to_delete.append(self._unindex_member(member_id, event_hash, team_hash))
+                members_deleted[member_id] = None
+        self._drop("member_df", members_to_delete)
+
+        teams_to_delete = [self._unindex_team(event_hash, team_hash) for team_hash in list(self.event_teams.get(event_hash, {}))]
+        self._drop("team_df", teams_to_delete)
+        self.event_teams.pop(event_hash, None)
+        self.open_teams.pop(event_hash, None)
+        self.themes_to_create.pop(event_hash, None)
+
+        themes_to_delete = [self.theme_rows.pop((event_hash, theme_hash)) for theme_hash in self.event_themes.pop(event_hash, {})]
+        self._drop("theme_df", themes_to_delete)
+
+        self._drop("event_df", [self.event_rows.pop(event_hash)])
+        return list(members_deleted)
+
+
+    def rotate_log(self):
+        # текущий журнал переносится в .old и удаляется только после успешной записи снимка
+        self.log_file.close()
+        if os.path.exists(self.log_url + ".old"):
+            with open(self.log_url, encoding="utf-8") as log, open(self.log_url + ".old", "a", encoding="utf-8") as old:
+                old.write(log.read())
+            os.remove(self.log_url)
+        else:
+            os.replace(self.log_url, self.log_url + ".old")
+        self.log_file = open(self.log_url, "a", encoding="utf-8")
+
+
+    def snapshot(self):
+        # короткая критическая секция: копии таблиц и номер последней записи журнала согласованы между собой;
+        # буферы копируются вместе с таблицами, а не переносятся в них, чтобы не подменять таблицы под читающими потоками
+        with self.lock:
+            self.rotate_log()
+            return [self._merged(name).drop(index=list(self.dropped[name]))
+                    for name in ["event_df", "theme_df", "team_df", "member_df"]], self.get_meta()
 
 
     def save_data(self):
-        with pd.ExcelWriter(self.data_url) as writer:
-            self.event_df.to_excel(writer, "Event", index=False)
-            self.theme_df.to_excel(writer, "Theme", index=False)
-            self.team_df.to_excel(writer, "Team", index=False)
-            self.member_df.to_excel(writer, "Member", index=False)
+        with self.save_lock:
+            [event_df, theme_df, team_df, member_df], meta = self.snapshot()
+            tmp_url = "~" + os.path.basename(self.data_url)
+            tmp_url = os.path.join(os.path.dirname(self.data_url), tmp_url)
+            with pd.ExcelWriter(tmp_url) as writer:
+                event_df.to_excel(writer, sheet_name="Event", index=False)
+                theme_df.to_excel(writer, sheet_name="Theme", index=False)
+                team_df.to_excel(writer, sheet_name="Team", index=False)
+                member_df.to_excel(writer, sheet_name="Member", index=False)
+                pd.DataFrame.from_records([meta]).to_excel(writer, sheet_name="Meta", index=False)
+            os.replace(tmp_url, self.data_url)
+
+            # снимок пишется после xlsx, чтобы при следующем запуске он считался более новым
+            with open(self.snapshot_url + ".tmp", "wb") as snapshot:
+                pickle.dump(([event_df, theme_df, team_df, member_df], meta), snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(self.snapshot_url + ".tmp", self.snapshot_url)
+            os.remove(self.log_url + ".old")
@@ -1,14 +1,24 @@
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters, CallbackContext, ConversationHandler, CallbackQueryHandler
+from telegram.ext import Application, ApplicationBuilder, CommandHandler, ContextTypes, MessageHandler, filters, CallbackContext, ConversationHandler, CallbackQueryHandler
 from telegram.error import BadRequest
 
+import os
+import logging
 from warnings import filterwarnings
 from telegram.warnings import PTBUserWarning
 
 from threading import Thread
-from time import sleep
-
-from data_manage import Reader
+from time import sleep, perf_counter
+
+import config
+from async_reader import AsyncReader, Reader
+from update_processor import UserOrderedUpdateProcessor
+from upload import ThemesUploader
+from cache import ThemeCardCache
+from notifications import Notifier, DigestQueue
+from persistence import SqlitePersistence
+from metrics import Metrics, MeteredRequest
+from profiler import Profiler
 
 filterwarnings(action="ignore", message=r".*CallbackQueryHandler", category=PTBUserWarning)
 
@@ -53,8 +63,8 @@ async def create_event(update: Update, context: CallbackContext) -> int:
 
 async def get_event_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     event_name = update.message.text
-    reader = Reader()
-    if not reader.is_event_name_unique(event_name):
+    reader = AsyncReader()
+    if not await reader.is_event_name_unique(event_name):
         await update.message.reply_text("Мероприятие с таким названием уже существует.")
         return EVENT_NAME
     context.user_data["event_name"] = event_name
@@ -68,8 +78,7 @@ async def get_event_name(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 async def get_event_max_members(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     members_amount = update.message.text
-    reader = Reader()
-    if not reader.is_digit(members_amount):
+    if not Reader.is_digit(members_amount):
         await update.message.reply_text("Введите число.")
         return EVENT_MAX_MEMBERS
     context.user_data["members_amount"] = int(members_amount)
@@ -88,15 +97,14 @@ async def get_themes_file(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await update.message.reply_text("Неверный формат файла. Отправьте файл заново.")
         return UPLOAD_THEMES
     
-    to_download = await context.bot.get_file(file)
-    file_name = await to_download.download_to_drive()
+    if file.file_size and file.file_size > config.MAX_UPLOAD_SIZE:
+        await update.message.reply_text(ThemesUploader.size_error() + " Отправьте файл заново.")
+        return UPLOAD_THEMES
 
-    event_name = context.user_data["event_name"]
-    max_members = context.user_data["members_amount"]
-    org_id = update.message.from_user.id
-    alias = update.message.from_user.username
-    reader = Reader()
-    errors = reader.add_event_theme(event_name=event_name, org_id=org_id, alias=alias, max_members=max_members, file_url=file_name)
+    uploader = ThemesUploader()
+    progress = await update.message.reply_text("Файл получен. Ожидание очереди на обработку..." if uploader.is_busy()
+                                               else "Файл получен.")
+    errors, themes = await uploader.read_themes(file, progress)
     if errors:
         error_msg = ""
         for index, error in enumerate(errors):
@@ -105,11 +113,20 @@ async def get_themes_file(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 break
             error_msg += error + "\n\n"
         error_msg += "Исправьте ошибки и отправьте файл заново."
-        await update.message.reply_text(error_msg)
+        await progress.edit_text(error_msg)
         return UPLOAD_THEMES
-    
-    await update.message.reply_text(f"Создано мероприятие с названием \"{event_name}\" и "
-                                    f"максимальным количеством учаснитков в одной команде {max_members}. Темы успешно загружены.")
+
+    event_name = context.user_data["event_name"]
+    max_members = context.user_data["members_amount"]
+    org_id = update.message.from_user.id
+    alias = update.message.from_user.username
+    reader = AsyncReader()
+    if await reader.add_event(event_name=event_name, org_id=org_id, alias=alias, max_members=max_members, themes=themes) == 1:
+        await progress.edit_text("К сожалению, уже появилось мероприятие с таким названием. Напишите другое название.")
+        return EVENT_NAME
+
+    await progress.edit_text(f"Создано мероприятие с названием \"{event_name}\" и "
+                             f"максимальным количеством учаснитков в одной команде {max_members}. Темы успешно загружены.")
 
     return ConversationHandler.END
 
@@ -124,8 +141,8 @@ async def list_events(update: Update, context: CallbackContext) -> int:
     await remove_buttons(context.chat_data)
     context.user_data["command"] = update.message.text
     
-    reader = Reader()
-    events = reader.get_events()
+    reader = AsyncReader()
+    events = await reader.get_events()
 
     if len(events) == 0:
         await update.effective_message.reply_text("На данный момент никаких мероприятий нет.")
@@ -139,6 +156,26 @@ async def list_events(update: Update, context: CallbackContext) -> int:
     return EVENT_NAME
 
 
+async def get_themes_listing(user_data: dict, user_id: int, event_hash: int):
+    # список тем пересчитывается, только если мероприятие изменилось с момента прошлого запроса,
+    # перелистывание страниц берет срез из сохраненного списка
+    reader = AsyncReader()
+    command = user_data["command"]
+    key = (event_hash, command, await reader.get_event_version(event_hash))
+    cache = user_data.get("themes_cache")
+    if cache is not None and cache["key"] == key:
+        return cache["themes"]
+
+    if command == "/create_team":
+        themes = await reader.get_themes_to_create(user_id, event_hash)
+    elif command == "/join_team":
+        themes = await reader.get_themes_to_join(user_id, event_hash)
+    elif command == "/themes":
+        themes = await reader.get_all_themes(event_hash)
+    user_data["themes_cache"] = {"key": key, "themes": themes}
+    return themes
+
+
 async def select_event_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
@@ -153,18 +190,16 @@ async def select_event_button(update: Update, context: ContextTypes.DEFAULT_TYPE
         context.user_data["event_hash"] = int(query.data)
         context.user_data["slice_start"] = 0
     
-    reader = Reader()
+    reader = AsyncReader()
     event_hash = context.user_data["event_hash"]
-    event_name = reader.get_event_name(event_hash)
+    event_name = await reader.get_event_name(event_hash)
+    themes = await get_themes_listing(context.user_data, update.callback_query.from_user.id, event_hash)
 
     if context.user_data["command"] == "/create_team":
-        themes = reader.get_themes_to_create(update.callback_query.from_user.id, event_hash)
         msg_text = "Отображены только незанятые темы. Для просмотра всех тем используйте /themes."
     elif context.user_data["command"] == "/join_team":
-        themes = reader.get_themes_to_join(update.callback_query.from_user.id, event_hash)
         msg_text = "Отображены только темы, к командам которых можно присоединиться. Для просмотра всех тем используйте /themes."
     elif context.user_data["command"] == "/themes":
-        themes = reader.get_all_themes(event_hash)
         msg_text = "Отображены все темы."
 
     if themes == 1:
@@ -199,6 +234,33 @@ async def select_event_button(update: Update, context: ContextTypes.DEFAULT_TYPE
     return THEME_NAME
 
 
+def render_theme_card(theme_info: dict) -> str:
+    info_headers = ["Мероприятие: ", "Тема: ", "Заказчик: ", "Максимум команд: ", "Ответственный: ", "Email ответственного: ", "Описание темы: ", 
+                    "Предпосылки: ", "Проблема: ", "Ожидаемый результат: "]
+    text = ""
+    for index, key in enumerate(list(theme_info.keys())):
+        if key == 'theme_hash':
+            continue
+        if (theme_info[key] == None):
+            continue
+        text += info_headers[index] + str(theme_info[key]) + "\n\n"
+    return text
+
+
+async def get_theme_card(event_hash: int, theme_hash: int):
+    # данные темы не меняются после загрузки, поэтому готовый текст карточки хранится до удаления мероприятия
+    cache = ThemeCardCache()
+    text = cache.get(event_hash, theme_hash)
+    if text is None:
+        reader = AsyncReader()
+        theme_info = await reader.theme_info(event_hash, theme_hash)
+        if not theme_info:
+            return None
+        text = render_theme_card(theme_info)
+        cache.put(event_hash, theme_hash, text)
+    return text
+
+
 async def select_theme_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
@@ -206,22 +268,11 @@ async def select_theme_button(update: Update, context: ContextTypes.DEFAULT_TYPE
     event_hash = context.user_data["event_hash"]
     context.user_data["theme_hash"] = theme_hash
 
-    reader = Reader()
-    theme_info = reader.theme_info(event_hash, theme_hash)
+    text = await get_theme_card(event_hash, theme_hash)
 
-    if not theme_info:
+    if not text:
             msg = await query.edit_message_text("Мероприятие удалено.", reply_markup=None)
             return ConversationHandler.END
-    
-    info_headers = ["Мероприятие: ", "Тема: ", "Заказчик: ", "Максимум команд: ", "Ответственный: ", "Email ответственного: ", "Описание темы: ", 
-                    "Предпосылки: ", "Проблема: ", "Ожидаемый результат: "]
-    text = ""
-    for index, key in enumerate(list(theme_info.keys())):
-        if key == 'theme_hash':
-            continue
-        if (theme_info[key] == None):
-            continue
-        text += info_headers[index] + str(theme_info[key]) + "\n\n"
 
     keyboard = [[InlineKeyboardButton("Назад", callback_data="return#"), InlineKeyboardButton("Выбрать эту тему", callback_data="next#")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -239,8 +290,8 @@ async def confirm_theme_button(update: Update, context: ContextTypes.DEFAULT_TYP
 
     if context.user_data["command"] == "/create_team" or query.data == 'jump_to_create#':
         await remove_buttons(context.chat_data)
-        reader = Reader()
-        proceed = reader.is_create_theme_available(update.callback_query.from_user.id, event_hash, theme_hash)
+        reader = AsyncReader()
+        proceed = await reader.is_create_theme_available(update.callback_query.from_user.id, event_hash, theme_hash)
         if not proceed:
             await update._effective_message.reply_text("К сожалению, вы больше не можете присоединиться "
                                                     "к данной теме.")
@@ -249,8 +300,8 @@ async def confirm_theme_button(update: Update, context: ContextTypes.DEFAULT_TYP
         await update._effective_message.reply_text("Введите название команды.")
 
     elif context.user_data["command"] == "/join_team" or query.data == 'jump_to_join#':
-        reader = Reader()
-        teams = reader.get_teams_to_join(update.callback_query.from_user.id, event_hash, theme_hash)
+        reader = AsyncReader()
+        teams = await reader.get_teams_to_join(update.callback_query.from_user.id, event_hash, theme_hash)
         await remove_buttons(context.chat_data)
 
         if teams == 1:
@@ -277,8 +328,8 @@ async def get_team_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     team_name = update.message.text
     context.user_data["team_name"] = team_name
 
-    reader = Reader()
-    if not reader.is_team_name_unique(event_hash, team_name):
+    reader = AsyncReader()
+    if not await reader.is_team_name_unique(event_hash, team_name):
         await update.message.reply_text("Команда с таким названием уже участвует в данном мероприятии. Введите другое название.")
         return TEAM_NAME
     
@@ -294,21 +345,21 @@ async def get_team_description(update: Update, context: ContextTypes.DEFAULT_TYP
     team_name = context.user_data["team_name"]
     team_description = update.message.text
 
-    reader = Reader()
-    event_name = reader.get_event_name(event_hash)
-    theme_name = reader.get_theme_name(event_hash, theme_hash)
+    reader = AsyncReader()
+    event_name = await reader.get_event_name(event_hash)
+    theme_name = await reader.get_theme_name(event_hash, theme_hash)
 
-    if not reader.is_team_name_unique(event_hash, team_name):
+    if not await reader.is_team_name_unique(event_hash, team_name):
         await update.message.reply_text("К сожалению, уже появилась команда с выбранным вами названием. Введите другое название.")
         return TEAM_NAME
     
-    proceed = reader.is_create_theme_available(update.message.from_user.id, event_hash, theme_hash)
+    proceed = await reader.is_create_theme_available(update.message.from_user.id, event_hash, theme_hash)
     if not proceed:
         await update._effective_message.reply_text("К сожалению, вы больше не можете присоединиться "
                                                     "к данной теме.")
         return ConversationHandler.END
     
-    reader.add_team(event_hash, theme_hash, team_name, update.message.from_user.id, update.message.from_user.username, team_description)
+    await reader.add_team(event_hash, theme_hash, team_name, update.message.from_user.id, update.message.from_user.username, team_description)
     await update.message.reply_text(f"Создана команда \"{team_name}\" в мероприятии \"{event_name}\" "
                                     f"По теме \"{theme_name}\".\n\nВ данный момент команда является открытой, и "
                                     "желающие принять участие в мероприятии могут отправлять вам запросы на "
@@ -334,9 +385,9 @@ async def select_team_button(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     await remove_buttons(context.chat_data)
 
-    reader = Reader()
-    team_name = reader.get_team_name(event_hash, team_hash)
-    team_needs = reader.get_team_description(event_hash, team_hash)
+    reader = AsyncReader()
+    team_name = await reader.get_team_name(event_hash, team_hash)
+    team_needs = await reader.get_team_description(event_hash, team_hash)
     keyboard = [[InlineKeyboardButton("Назад", callback_data="back#"), InlineKeyboardButton("Присоединиться", callback_data="join#")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -351,8 +402,8 @@ async def send_join_request(update: Update, context: ContextTypes.DEFAULT_TYPE)
     event_hash = context.user_data["event_hash"]
     team_hash = context.user_data["team_hash"]
 
-    reader = Reader()
-    leader_data = reader.add_member_to_team(update.callback_query.from_user.id, update.callback_query.from_user.username, event_hash, team_hash)
+    reader = AsyncReader()
+    leader_data = await reader.add_member_to_team(update.callback_query.from_user.id, update.callback_query.from_user.username, event_hash, team_hash)
     if leader_data == 1:
         await query.edit_message_text("Не удалось присоединиться. Вы уже участвуете в этом мероприятии.", reply_markup=None)
         return ConversationHandler.END
@@ -363,19 +414,14 @@ async def send_join_request(update: Update, context: ContextTypes.DEFAULT_TYPE)
     leader_id = leader_data['leader_id']
     leader_alias = leader_data['leader_alias']
     team_name = leader_data['team_name']
-    event_name = reader.get_event_name(event_hash)
-
-    try:
-        await context.bot.send_message(chat_id=leader_id, text=f"Был отправлен запрос на присоединение к команде \"{team_name}\" "
-                                 f"в мероприятии \"{event_name}\" от пользователя @{update.callback_query.from_user.username}. "
-                                 f"Чтобы принять или отклонить запрос, используйте /my_teams.")
-        
-        await query.edit_message_text(f"Лидеру команды \"{team_name}\" @{leader_alias} был отправлен ваш запрос на присоединение. "
-                                      "Рекомендуем связаться с лидером для обсуждения вашего участия.", reply_markup=None)
-    except Exception:
-        await query.edit_message_text(f"Лидеру команды \"{team_name}\" @{leader_alias} был отправлен ваш запрос на присоединение. "
-                                      "но уведомить его не удалось. Он может принять или отклонить запрос используя /my_teams. "
-                                      "Рекомендуем связаться с лидером для обсуждения вашего участия.", reply_markup=None)
+    event_name = await reader.get_event_name(event_hash)
+
+    # запросы, пришедшие в течение config.DIGEST_WINDOW, лидер получит одним сообщением
+    # если уведомление лидеру не удастся доставить, пользователь получит об этом отдельное сообщение
+    DigestQueue().add(context.bot, leader_id, event_hash, team_hash, event_name, team_name,
+                      update.callback_query.from_user.username, update.callback_query.from_user.id)
+    await query.edit_message_text(f"Лидеру команды \"{team_name}\" @{leader_alias} был отправлен ваш запрос на присоединение. "
+                                  "Рекомендуем связаться с лидером для обсуждения вашего участия.", reply_markup=None)
     return ConversationHandler.END
     
 
@@ -390,8 +436,8 @@ async def list_member_events(update: Update, context: CallbackContext) -> int:
     await remove_buttons(context.chat_data)
     context.user_data["command"] = update.message.text
     
-    reader = Reader()
-    events = reader.get_member_events(update.message.from_user.id)
+    reader = AsyncReader()
+    events = await reader.get_member_events(update.message.from_user.id)
 
     if not events:
         await update.message.reply_text("На данный момент вы не являетесь участником ни одной команды.")
@@ -405,6 +451,33 @@ async def list_member_events(update: Update, context: CallbackContext) -> int:
     return EVENT_NAME
 
 
+def render_team_dashboard(dashboard: dict, user_id: int):
+    if dashboard['team_opened']:
+        team_opened = "открыта для запросов"
+        flip_team_state = "Закрыть команду"
+    else:
+        team_opened = "закрыта для запросов"
+        flip_team_state = "Открыть команду"
+
+    text = (f"Мероприятие: {dashboard['event']}\n\n"
+            f"Тема: {dashboard['theme']}\n\n"
+            f"Команда: {dashboard['team_name']}\n\n"
+            f"Лидер: @{dashboard['leader_alias']}\n\n"
+            f"Команда {team_opened}\n\n"
+            f"Команда ищет: {dashboard['team_needs']}\n\n"
+            f"Участники {dashboard['members']}/{dashboard['max_members']}\n\n")
+
+    if dashboard['leader_id'] == user_id:
+        keyboard = [[InlineKeyboardButton("Принять/отклонить запрос в команду", callback_data="answer#")],
+                    [InlineKeyboardButton(flip_team_state, callback_data="flip_state#")],
+                    [InlineKeyboardButton("Исключить участника", callback_data="kick#")],
+                    [InlineKeyboardButton("Изменить параметр \"Команда ищет\"", callback_data="change_need#")],
+                    [InlineKeyboardButton("Удалить команду", callback_data="delete#")]]
+    else:
+        keyboard = [[InlineKeyboardButton("Покинуть команду", callback_data="quit#")]]
+    return text, InlineKeyboardMarkup(keyboard)
+
+
 async def list_team_info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
@@ -413,52 +486,21 @@ async def list_team_info(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     elif query.data == "flip_state#":
         event_hash = context.user_data["event_hash"]
         team_hash = context.user_data['team_hash']
-        reader = Reader()
-        reader.flip_team_opened(event_hash, team_hash)
+        reader = AsyncReader()
+        await reader.flip_team_opened(event_hash, team_hash)
     else:
         event_hash = int(query.data)
         context.user_data["event_hash"] = event_hash
 
-    reader = Reader()
-    team_info = reader.get_team_info(update.callback_query.from_user.id, event_hash)
+    reader = AsyncReader()
+    dashboard = await reader.get_team_dashboard(update.callback_query.from_user.id, event_hash)
 
-    if not team_info:
+    if not dashboard:
             msg = await query.edit_message_text("Вы больше не участвуете в этом мероприятии.", reply_markup=None)
             return ConversationHandler.END
     
-    context.user_data['team_hash'] = team_info['team_hash']
-    
-    team_info['event_hash'] = reader.get_event_name(event_hash)
-    team_info['theme_hash'] = reader.get_theme_name(event_hash, team_info['theme_hash'])
-
-    max_members = reader.get_max_members(event_hash)
-    cur_members = reader.get_current_members(event_hash, team_info['team_hash'])
-    team_info['members'] = f"{cur_members}/{max_members}"
-    if team_info['team_opened']:
-        team_info['team_opened'] = "открыта для запросов"
-        flip_team_state = "Закрыть команду"
-    else:
-        team_info['team_opened'] = "закрыта для запросов"
-        flip_team_state = "Открыть команду"
-    
-    info_headers = ["Мероприятие: ", "Тема: ", "Команда: ", "", "Лидер: @", "Команда ", "Команда ищет: ", "", "Участники "]
-    text = ""
-    for index, key in enumerate(list(team_info.keys())):
-        if key == 'leader_id':
-            continue
-        if key == 'team_hash':
-            continue
-        text += info_headers[index] + str(team_info[key]) + "\n\n"
-
-    if team_info['leader_id'] == update.callback_query.from_user.id:
-        keyboard = [[InlineKeyboardButton("Принять/отклонить запрос в команду", callback_data="answer#")],
-                    [InlineKeyboardButton(flip_team_state, callback_data="flip_state#")],
-                    [InlineKeyboardButton("Исключить участника", callback_data="kick#")],
-                    [InlineKeyboardButton("Изменить параметр \"Команда ищет\"", callback_data="change_need#")],
-                    [InlineKeyboardButton("Удалить команду", callback_data="delete#")]]
-    else:
-        keyboard = [[InlineKeyboardButton("Покинуть команду", callback_data="quit#")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    context.user_data['team_hash'] = dashboard['team_hash']
+    text, reply_markup = render_team_dashboard(dashboard, update.callback_query.from_user.id)
     msg = await query.edit_message_text(text, reply_markup=reply_markup)
     context.chat_data["buttons_message"] = msg
 
@@ -471,8 +513,8 @@ async def list_requests(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     event_hash = context.user_data["event_hash"]
     team_hash = context.user_data['team_hash']
 
-    reader = Reader()
-    not_accepted = reader.get_not_accepted_members(event_hash, team_hash)
+    reader = AsyncReader()
+    not_accepted = await reader.get_not_accepted_members(event_hash, team_hash)
 
     if not not_accepted:
             keyboard = [[InlineKeyboardButton("Назад", callback_data="back#")]]
@@ -496,8 +538,8 @@ async def answer_request(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await query.answer()
     user_id = int(query.data)
 
-    reader = Reader()
-    user_alias = reader.get_user_alias(user_id)
+    reader = AsyncReader()
+    user_alias = await reader.get_user_alias(user_id)
     context.user_data["user_id"] = user_id
     context.user_data["user_alias"] = user_alias
 
@@ -518,10 +560,10 @@ async def confirm_request(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     user_id = context.user_data["user_id"]
     user_alias = context.user_data["user_alias"]
 
-    reader = Reader()
-    event_name = reader.get_event_name(event_hash)
-    team_name = reader.get_team_name(event_hash, team_hash)
-    members_amount = reader.accept_member(event_hash, team_hash, user_id)
+    reader = AsyncReader()
+    event_name = await reader.get_event_name(event_hash)
+    team_name = await reader.get_team_name(event_hash, team_hash)
+    members_amount = await reader.accept_member(event_hash, team_hash, user_id)
 
     if members_amount == 1:
         message_to_send = "Невозможно принять запрос, команда заполнена."
@@ -529,12 +571,9 @@ async def confirm_request(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         message_to_send = "Пользователь был принят в другую команду."
     else:
         message_to_send = f"Пользователь @{user_alias} теперь является участником команды.\nУчастников команды {members_amount[1]}/{members_amount[0]}."
-        try:
-            await context.bot.send_message(chat_id=user_id, text=f"Ваш запрос на присоединение к команде \"{team_name}\" "
-                                 f"в мероприятии \"{event_name}\" был принят. "
-                                 f"Чтобы просмотреть информацию о команде, используйте /my_teams.")
-        except Exception:
-            pass
+        Notifier().notify(context.bot, [user_id], f"Ваш запрос на присоединение к команде \"{team_name}\" "
+                          f"в мероприятии \"{event_name}\" был принят. "
+                          f"Чтобы просмотреть информацию о команде, используйте /my_teams.")
 
     keyboard = [[InlineKeyboardButton("ОК", callback_data="back#")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -552,16 +591,13 @@ async def reject_request(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     user_id = context.user_data["user_id"]
     user_alias = context.user_data["user_alias"]
 
-    reader = Reader()
-    event_name = reader.get_event_name(event_hash)
-    team_name = reader.get_team_name(event_hash, team_hash)
-    reader.remove_member(event_hash, team_hash, user_id)
+    reader = AsyncReader()
+    event_name = await reader.get_event_name(event_hash)
+    team_name = await reader.get_team_name(event_hash, team_hash)
+    await reader.remove_member(event_hash, team_hash, user_id)
 
-    try:
-        await context.bot.send_message(chat_id=user_id, text=f"Ваш запрос на присоединение к команде \"{team_name}\" "
-                                f"в мероприятии \"{event_name}\" был отлонен. ")
-    except Exception:
-        pass
+    Notifier().notify(context.bot, [user_id], f"Ваш запрос на присоединение к команде \"{team_name}\" "
+                      f"в мероприятии \"{event_name}\" был отлонен. ")
     keyboard = [[InlineKeyboardButton("ОК", callback_data="back#")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     msg = await query.edit_message_text(f"Запрос пользователя @{user_alias} отклонен.", reply_markup=reply_markup)
@@ -576,8 +612,8 @@ async def list_members(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     event_hash = context.user_data["event_hash"]
     team_hash = context.user_data["team_hash"]
 
-    reader = Reader()
-    members = reader.get_team_members(update.callback_query.from_user.id, event_hash, team_hash)
+    reader = AsyncReader()
+    members = await reader.get_team_members(update.callback_query.from_user.id, event_hash, team_hash)
     keyboard = []
     if not members:
         msg_text = "Участником команды являетесь только вы."
@@ -597,8 +633,8 @@ async def choose_member(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     await query.answer()
     user_id = int(query.data)
 
-    reader = Reader()
-    user_alias = reader.get_user_alias(user_id)
+    reader = AsyncReader()
+    user_alias = await reader.get_user_alias(user_id)
     context.user_data["user_id"] = user_id
     context.user_data["user_alias"] = user_alias
 
@@ -618,16 +654,13 @@ async def confirm_kick(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     user_id = context.user_data["user_id"]
     user_alias = context.user_data["user_alias"]
 
-    reader = Reader()
-    event_name = reader.get_event_name(event_hash)
-    team_name = reader.get_team_name(event_hash, team_hash)
-    reader.remove_member(event_hash, team_hash, user_id)
+    reader = AsyncReader()
+    event_name = await reader.get_event_name(event_hash)
+    team_name = await reader.get_team_name(event_hash, team_hash)
+    await reader.remove_member(event_hash, team_hash, user_id)
 
-    try:
-        await context.bot.send_message(chat_id=user_id, text=f"Вы были исключены из команды \"{team_name}\" "
-                                f"в мероприятии \"{event_name}\".")
-    except Exception:
-        pass
+    Notifier().notify(context.bot, [user_id], f"Вы были исключены из команды \"{team_name}\" "
+                      f"в мероприятии \"{event_name}\".")
     keyboard = [[InlineKeyboardButton("ОК", callback_data="back#")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     msg = await query.edit_message_text(f"Участник @{user_alias} исключен.", reply_markup=reply_markup)
@@ -651,47 +684,16 @@ async def set_new_needs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     event_hash = context.user_data["event_hash"]
     team_hash = context.user_data["team_hash"]
 
-    reader = Reader()
-    reader.change_team_needs(event_hash, team_hash, new_needs)
-    team_info = reader.get_team_info(update.message.from_user.id, event_hash)
+    reader = AsyncReader()
+    await reader.change_team_needs(event_hash, team_hash, new_needs)
+    dashboard = await reader.get_team_dashboard(update.message.from_user.id, event_hash)
 
-    if not team_info:
+    if not dashboard:
             await update.message.reply_text("Вы больше не участвуете в этом мероприятии.", reply_markup=None)
             return ConversationHandler.END
     
-    context.user_data['team_hash'] = team_info['team_hash']
-    
-    team_info['event_hash'] = reader.get_event_name(event_hash)
-    team_info['theme_hash'] = reader.get_theme_name(event_hash, team_info['theme_hash'])
-
-    max_members = reader.get_max_members(event_hash)
-    cur_members = reader.get_current_members(event_hash, team_info['team_hash'])
-    team_info['members'] = f"{cur_members}/{max_members}"
-    if team_info['team_opened']:
-        team_info['team_opened'] = "открыта для запросов"
-        flip_team_state = "Закрыть команду"
-    else:
-        team_info['team_opened'] = "закрыта для запросов"
-        flip_team_state = "Открыть команду"
-    
-    info_headers = ["Мероприятие: ", "Тема: ", "Команда: ", "", "Лидер: @", "Команда ", "Команда ищет: ", "", "Участники "]
-    text = ""
-    for index, key in enumerate(list(team_info.keys())):
-        if key == 'leader_id':
-            continue
-        if key == 'team_hash':
-            continue
-        text += info_headers[index] + str(team_info[key]) + "\n\n"
-
-    if team_info['leader_id'] == update.message.from_user.id:
-        keyboard = [[InlineKeyboardButton("Принять/отклонить запрос в команду", callback_data="answer#")],
-                    [InlineKeyboardButton(flip_team_state, callback_data="flip_state#")],
-                    [InlineKeyboardButton("Исключить участника", callback_data="kick#")],
-                    [InlineKeyboardButton("Изменить параметр \"Команда ищет\"", callback_data="change_need#")],
-                    [InlineKeyboardButton("Удалить команду", callback_data="delete#")]]
-    else:
-        keyboard = [[InlineKeyboardButton("Покинуть команду", callback_data="quit#")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    context.user_data['team_hash'] = dashboard['team_hash']
+    text, reply_markup = render_team_dashboard(dashboard, update.message.from_user.id)
     msg = await update.message.reply_text(text, reply_markup=reply_markup)
     context.chat_data["buttons_message"] = msg
 
@@ -704,8 +706,8 @@ async def delete_team(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     event_hash = context.user_data["event_hash"]
     team_hash = context.user_data["team_hash"]
 
-    reader = Reader()
-    team_name = reader.get_team_name(event_hash, team_hash)
+    reader = AsyncReader()
+    team_name = await reader.get_team_name(event_hash, team_hash)
 
     keyboard = [[InlineKeyboardButton("Отмена", callback_data="back#"), InlineKeyboardButton("Удалить", callback_data="confirm#")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -721,19 +723,15 @@ async def confirm_delete(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     event_hash = context.user_data["event_hash"]
     team_hash = context.user_data["team_hash"]
 
-    reader = Reader()
-    event_name = reader.get_event_name(event_hash)
-    team_name = reader.get_team_name(event_hash, team_hash)
-    members_deleted = reader.delete_team(event_hash, team_hash, update.callback_query.from_user.id)
+    reader = AsyncReader()
+    event_name = await reader.get_event_name(event_hash)
+    team_name = await reader.get_team_name(event_hash, team_hash)
+    members_deleted = await reader.delete_team(event_hash, team_hash, update.callback_query.from_user.id)
 
     await query.edit_message_text(f"Команда \"{team_name}\" удалена. Вы больше не участвуете в мероприятии \"{event_name}\"", reply_markup=None)
 
-    for member_id in members_deleted:
-        try:
-            await context.bot.send_message(chat_id=member_id, text=f"Команда \"{team_name}\" была удалена. "
-                                 f"Вы больше не участвуете в мероприятии \"{event_name}\".")
-        except Exception:
-            pass
+    Notifier().notify(context.bot, members_deleted, f"Команда \"{team_name}\" была удалена. "
+                      f"Вы больше не участвуете в мероприятии \"{event_name}\".")
 
     return ConversationHandler.END
 
@@ -744,8 +742,8 @@ async def quit_team(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     event_hash = context.user_data["event_hash"]
     team_hash = context.user_data["team_hash"]
 
-    reader = Reader()
-    team_name = reader.get_team_name(event_hash, team_hash)
+    reader = AsyncReader()
+    team_name = await reader.get_team_name(event_hash, team_hash)
 
     keyboard = [[InlineKeyboardButton("Отмена", callback_data="back#"), InlineKeyboardButton("Покинуть", callback_data="confirm#")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -761,20 +759,17 @@ async def confirm_quit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     event_hash = context.user_data["event_hash"]
     team_hash = context.user_data["team_hash"]
 
-    reader = Reader()
-    event_name = reader.get_event_name(event_hash)
-    team_name = reader.get_team_name(event_hash, team_hash)
-    leader_id = reader.get_leader_id(event_hash, team_hash)
+    reader = AsyncReader()
+    event_name = await reader.get_event_name(event_hash)
+    team_name = await reader.get_team_name(event_hash, team_hash)
+    leader_id = await reader.get_leader_id(event_hash, team_hash)
     member_alias = update.callback_query.from_user.username
-    reader.remove_member(event_hash, team_hash, update.callback_query.from_user.id)
+    await reader.remove_member(event_hash, team_hash, update.callback_query.from_user.id)
 
     await query.edit_message_text(f"Вы покинули команду \"{team_name}\". Вы больше не участвуете в мероприятии \"{event_name}\"", reply_markup=None)
 
-    try:
-        await context.bot.send_message(chat_id=int(leader_id), text=f"Участник @{member_alias} покинул команду \"{team_name}\" "
-                                       f"мероприятия \"{event_name}\".")
-    except Exception:
-        pass
+    Notifier().notify(context.bot, [int(leader_id)], f"Участник @{member_alias} покинул команду \"{team_name}\" "
+                      f"мероприятия \"{event_name}\".")
 
     return ConversationHandler.END
 
@@ -793,38 +788,22 @@ async def set_theme_options(update: Update, context: ContextTypes.DEFAULT_TYPE)
     event_hash = context.user_data["event_hash"]
     context.user_data["theme_hash"] = theme_hash
 
-    reader = Reader()
-    theme_info = reader.theme_info(event_hash, theme_hash)
+    text = await get_theme_card(event_hash, theme_hash)
 
-    if not theme_info:
+    if not text:
             msg = await query.edit_message_text("Мероприятие удалено.", reply_markup=None)
             return ConversationHandler.END
-    
-    info_headers = ["Мероприятие: ", "Тема: ", "Заказчик: ", "Максимум команд: ", "Ответственный: ", "Email ответственного: ", "Описание темы: ", 
-                    "Предпосылки: ", "Проблема: ", "Ожидаемый результат: "]
-    text = ""
-    for index, key in enumerate(list(theme_info.keys())):
-        if key == 'theme_hash':
-            continue
-        if (theme_info[key] == None):
-            continue
-        text += info_headers[index] + str(theme_info[key]) + "\n\n"
 
     first_row_keyboard = []
     keyboard = []
-    themes_to_join = reader.get_themes_to_join(update.callback_query.from_user.id, event_hash)
-    themes_to_create = reader.get_themes_to_create(update.callback_query.from_user.id, event_hash)
-
-    if themes_to_join != 1 and themes_to_create != 1:
-        for theme in themes_to_join:
-            if theme['theme_hash'] == theme_hash:
-                first_row_keyboard.append(InlineKeyboardButton("Присоединиться к команде", callback_data="jump_to_join#"))
-                break
-
-        for theme in themes_to_create:
-            if theme['theme_hash'] == theme_hash:
-                first_row_keyboard.append(InlineKeyboardButton("Создать команду", callback_data="jump_to_create#"))
-                
+    reader = AsyncReader()
+    options = await reader.get_theme_options(update.callback_query.from_user.id, event_hash, theme_hash)
+
+    if options != 1:
+        if options['join']:
+            first_row_keyboard.append(InlineKeyboardButton("Присоединиться к команде", callback_data="jump_to_join#"))
+        if options['create']:
+            first_row_keyboard.append(InlineKeyboardButton("Создать команду", callback_data="jump_to_create#"))
         keyboard.append(first_row_keyboard)
 
     keyboard.append([InlineKeyboardButton("Назад", callback_data="return_to_themes#")])
@@ -849,8 +828,8 @@ async def list_user_events(update: Update, context: CallbackContext) -> int:
         user_id = update.message.from_user.id
     except AttributeError:
         user_id = update.callback_query.from_user.id
-    reader = Reader()
-    events = reader.get_user_events(user_id)
+    reader = AsyncReader()
+    events = await reader.get_user_events(user_id)
 
     if len(events) == 0:
         await update.effective_message.reply_text("Вы не являетесь организатором ни одного мероприятия.")
@@ -873,8 +852,8 @@ async def confirm_delete_event(update: Update, context: ContextTypes.DEFAULT_TYP
     event_hash = int(query.data)
     context.user_data["event_hash"] = event_hash
 
-    reader = Reader()
-    event_name = reader.get_event_name(event_hash)
+    reader = AsyncReader()
+    event_name = await reader.get_event_name(event_hash)
 
     keyboard = [[InlineKeyboardButton("Отмена", callback_data="back#"), InlineKeyboardButton("Удалить", callback_data="confirm#")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -889,11 +868,14 @@ async def delete_event(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     await query.answer()
     event_hash = context.user_data["event_hash"]
 
-    reader = Reader()
-    event_name = reader.get_event_name(event_hash)
-    reader.delete_event(event_hash)
+    reader = AsyncReader()
+    event_name = await reader.get_event_name(event_hash)
+    members_deleted = await reader.delete_event(event_hash)
+    ThemeCardCache().invalidate_event(event_hash)
 
     await query.edit_message_text(f"Мероприятие \"{event_name}\" удалено.", reply_markup=None)
+    Notifier().notify(context.bot, members_deleted, f"Мероприятие \"{event_name}\" было удалено организатором. "
+                      "Вы больше не участвуете в этом мероприятии.")
 
     return ConversationHandler.END
 
@@ -905,18 +887,127 @@ async def cancel_delete_event(update: Update, context: ContextTypes.DEFAULT_TYPE
     return ConversationHandler.END
 
 
+async def profile(update: Update, context: CallbackContext) -> None:
+    profiler = Profiler()
+    if profiler.active:
+        await update.message.reply_text("Профилирование уже запущено.")
+        return
+    seconds, updates = 30, 0
+    try:
+        if context.args[:1] == ["updates"]:
+            updates = int(context.args[1])
+            seconds = config.PROFILE_MAX_SECONDS
+        elif context.args:
+            seconds = float(context.args[0])
+    except (ValueError, IndexError):
+        await update.message.reply_text("Использование: /profile [секунд] или /profile updates <число обновлений>.")
+        return
+
+    profiler.begin(context.application)
+    limit = f"{updates} обновлений" if updates else f"{min(seconds, config.PROFILE_MAX_SECONDS):g} с"
+    await update.message.reply_text(f"Профилирование запущено на {limit}, отчет придет в этот чат.")
+    # обработчик не ждет окончания профилирования, иначе при последовательной обработке обновлений бот остановится
+    context.application.create_task(send_profile(context.application, update.effective_chat.id, seconds, updates))
+
+
+async def send_profile(application: Application, chat_id: int, seconds: float, updates: int) -> None:
+    profiler = Profiler()
+    await profiler.finish(application, seconds, updates)
+    await application.bot.send_message(chat_id, profiler.summary()[:4096])
+    await application.bot.send_document(chat_id, profiler.report().encode(), filename="profile.txt")
+
+
+def process_rss():
+    # текущий размер процесса в памяти, доступен только в Linux
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return None
+
+
+def format_size(size) -> str:
+    if size is None:
+        return "?"
+    return f"{size / 1024:.0f} КБ" if size < 1024 * 1024 else f"{size / 1024 / 1024:.1f} МБ"
+
+
+async def memory(update: Update, context: CallbackContext) -> None:
+    reader = AsyncReader()
+    report = await reader.memory_report()
+    lines = [f"Хранилище: {report['backend']}, данные: {format_size(report['total_bytes'])}, "
+             f"процесс: {format_size(process_rss())}"]
+    if "cache_limit_bytes" in report:
+        lines.append(f"Кеш страниц SQLite: до {format_size(report['cache_limit_bytes'])}")
+    for table, info in sorted(report['tables'].items(), key=lambda item: -(item[1]['bytes'] or 0)):
+        lines.append("")
+        lines.append(f"{table}: строк {info['rows']}, {format_size(info['bytes'])}")
+        for column, column_info in sorted(info.get('columns', {}).items(), key=lambda item: -item[1]['bytes']):
+            lines.append(f"    {column} ({column_info['dtype']}): {format_size(column_info['bytes'])}")
+    await update.message.reply_text("\n".join(lines)[:4096])
+
+
 def save_data():
     while True:
         sleep(3600)
-        reader = Reader()
-        reader.save_data()
+        save_reader()
 
 
-def main() -> None:
-    application = Application.builder().token("7143101973:AAEqnB854KWCeQ2aVWaf4Y2qLGbt-EZTt8k").build()
+def save_reader():
+    start = perf_counter()
+    reader = Reader()
+    reader.save_data()
+    metrics = Metrics()
+    metrics.save_seconds.set(perf_counter() - start)
+    metrics.save_total.inc()
+
+
+def collect_metrics(metrics: Metrics) -> None:
+    # вызывается из потока HTTP сервера метрик перед каждой выдачей
+    for table, rows in Reader().get_table_sizes().items():
+        metrics.table_rows.set(rows, table)
+    notifier = Notifier()
+    for result in ["sent", "failed", "retried"]:
+        metrics.notifications.set(getattr(notifier, result), result)
+    for error, count in list(notifier.errors.items()):
+        metrics.notification_errors.set(count, error)
+    for stat, value in DigestQueue().stats().items():
+        metrics.digest.set(value, stat)
+    for stat, value in ThemeCardCache().stats().items():
+        metrics.cache.set(value, stat)
+
+
+async def stop_notifications(application: Application) -> None:
+    # накопленные запросы и начатые рассылки отправляются до остановки бота
+    await DigestQueue().drain()
+    await Notifier().drain()
+    logging.getLogger(__name__).info("Уведомления: %s, запросы лидерам: %s", Notifier().stats(), DigestQueue().stats())
+
+
+def run_application(application: Application) -> None:
+    if config.MODE == "webhook":
+        # webhook_url=None: вебхук уже зарегистрирован, например, балансировщиком или другим экземпляром
+        application.run_webhook(listen=config.WEBHOOK_LISTEN,
+                                port=config.WEBHOOK_PORT,
+                                url_path=config.WEBHOOK_PATH,
+                                webhook_url=config.WEBHOOK_URL or None,
+                                secret_token=config.WEBHOOK_SECRET,
+                                max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+                                allowed_updates=Update.ALL_TYPES)
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
+
+
+def build_application(builder: ApplicationBuilder) -> Application:
+    # builder задает подключение к Bot API, здесь добавляются обработчики; используется также симулятором нагрузки
+    if config.CONCURRENT_UPDATES:
+        builder.concurrent_updates(UserOrderedUpdateProcessor(config.CONCURRENT_UPDATES))
+    application = builder.build()
 
     application.add_handler(CommandHandler("start", start), group=0)
     application.add_handler(CommandHandler("help", start), group=0)
+    application.add_handler(CommandHandler("profile", profile, filters=filters.User(config.ADMIN_IDS)), group=0)
+    application.add_handler(CommandHandler("memory", memory, filters=filters.User(config.ADMIN_IDS)), group=0)
 
     # Создание мероприятия
     create_event_handler = ConversationHandler(
@@ -928,7 +1019,9 @@ def main() -> None:
         },
         fallbacks=[CommandHandler("cancel", cancel_create_event),
                    MessageHandler(filters.COMMAND, cancel_any)],
-        allow_reentry=True)
+        allow_reentry=True,
+        name="create_event",
+        persistent=True)
     application.add_handler(create_event_handler, group=1)
 
     # Создание команды
@@ -947,7 +1040,9 @@ def main() -> None:
         },
         fallbacks=[CommandHandler("cancel", cancel_create_team),
                    MessageHandler(filters.COMMAND, cancel_any)],
-        allow_reentry=True)
+        allow_reentry=True,
+        name="create_team",
+        persistent=True)
     application.add_handler(create_team_handler, group=2)
 
     # Присоединение к команде
@@ -967,7 +1062,9 @@ def main() -> None:
         },
         fallbacks=[CommandHandler("cancel", cancel_join_team),
                    MessageHandler(filters.COMMAND, cancel_any)],
-        allow_reentry=True)
+        allow_reentry=True,
+        name="join_team",
+        persistent=True)
     application.add_handler(join_team_handler, group=3)
 
     # Управление командой
@@ -998,7 +1095,9 @@ def main() -> None:
         },
         fallbacks=[CommandHandler("cancel", cancel_manage_team),
                    MessageHandler(filters.COMMAND, cancel_any)],
-        allow_reentry=True)
+        allow_reentry=True,
+        name="manage_team",
+        persistent=True)
     application.add_handler(manage_team_handler, group=4)
 
     # Просмотр всех тем
@@ -1013,7 +1112,9 @@ def main() -> None:
         },
         fallbacks=[CommandHandler("cancel", cancel_themes),
                    MessageHandler(filters.COMMAND, cancel_any)],
-        allow_reentry=True)
+        allow_reentry=True,
+        name="themes",
+        persistent=True)
     application.add_handler(all_themes_handler, group=5)
 
     # Удаление мероприятия
@@ -1026,19 +1127,41 @@ def main() -> None:
         },
         fallbacks=[CommandHandler("cancel", cancel_delete_event),
                    MessageHandler(filters.COMMAND, cancel_any)],
-        allow_reentry=True)
+        allow_reentry=True,
+        name="delete_event",
+        persistent=True)
     application.add_handler(delete_event_handler, group=6)
 
+    if Metrics().enabled:
+        Metrics().instrument(application)
+    return application
+
+
+def main() -> None:
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    # данные загружаются до запуска бота, а не при первом обновлении
+    Reader()
+
+    builder = (Application.builder().token(config.BOT_TOKEN).base_url(config.BASE_URL).base_file_url(config.BASE_FILE_URL)
+               .persistence(SqlitePersistence(config.PERSISTENCE_URL, config.PERSISTENCE_INTERVAL))
+               .post_stop(stop_notifications))
+    metrics = Metrics()
+    if metrics.enabled:
+        builder.request(MeteredRequest(connection_pool_size=256))
+        metrics.add_collector(collect_metrics)
+        metrics.start_server()
+    application = build_application(builder)
+
     save_timer = Thread(target=save_data)
     save_timer.daemon = True
     save_timer.start()
 
     try:
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        run_application(application)
     finally:
-        reader = Reader()
-        reader.save_data()
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        save_reader()
+        run_application(application)
 
 if __name__ == '__main__':
     main()
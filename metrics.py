@@ -0,0 +1,220 @@
+import logging
+from bisect import bisect_left
+from functools import wraps
+from threading import Lock, Thread
+from time import perf_counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telegram import Update
+from telegram.ext import ConversationHandler, TypeHandler
+from telegram.request import HTTPXRequest
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# границы корзин гистограмм в секундах: от быстрых запросов к индексам до загрузки файлов
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    escaped = [str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for value in values]
+    return "{" + ",".join(f"{name}=\"{value}\"" for name, value in zip(names, escaped)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = Lock()
+
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+    def set(self, value, *labels):
+        # для значений, которые уже подсчитываются в другом месте, например в Notifier
+        with self.lock:
+            self.values[labels] = value
+
+
+    def samples(self):
+        with self.lock:
+            return [(self.name + _labels(self.labels, labels), value) for labels, value in sorted(self.values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # метки -> [число наблюдений в каждой корзине (последняя - +Inf), сумма]
+        self.values = {}
+        self.lock = Lock()
+
+
+    def observe(self, seconds, *labels):
+        index = bisect_left(self.buckets, seconds)
+        with self.lock:
+            value = self.values.get(labels)
+            if value is None:
+                value = self.values[labels] = [[0] * (len(self.buckets) + 1), 0]
+            value[0][index] += 1
+            value[1] += seconds
+
+
+    def samples(self):
+        result = []
+        with self.lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in sorted(self.values.items())]
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip([*self.buckets, "+Inf"], counts):
+                cumulative += count
+                result.append((self.name + "_bucket" + _labels(self.labels + ("le",), labels + (bound,)), cumulative))
+            result.append((self.name + "_sum" + _labels(self.labels, labels), total))
+            result.append((self.name + "_count" + _labels(self.labels, labels), cumulative))
+        return result
+
+
+class Metrics:
+    def __new__(cls):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(Metrics, cls).__new__(cls)
+            cls.instance.__initialized = False
+        return cls.instance
+
+
+    def __init__(self):
+        if self.__initialized:
+            return
+        self.__initialized = True
+        # выключенные метрики не оборачивают обработчики и вызовы Reader, накладных расходов нет
+        self.enabled = config.METRICS_PORT != 0
+        self.updates = Counter("bot_updates_total", "Полученные обновления по типу", ("type",))
+        self.handler_seconds = Histogram("bot_handler_seconds", "Время выполнения обработчика", ("handler",))
+        self.handler_errors = Counter("bot_handler_errors_total", "Исключения в обработчиках", ("handler",))
+        self.reader_seconds = Histogram("bot_reader_seconds", "Время выполнения метода Reader", ("method",))
+        self.reader_wait_seconds = Histogram("bot_reader_wait_seconds", "Ожидание блокировки чтения/записи Reader", ("lock",))
+        self.api_seconds = Histogram("bot_api_seconds", "Время запроса к Bot API", ("method",))
+        self.notifications = Counter("bot_notifications_total", "Уведомления по результату", ("result",))
+        self.notification_errors = Counter("bot_notification_errors_total", "Ошибки отправки уведомлений", ("error",))
+        self.digest = Gauge("bot_digest", "Очередь запросов лидерам", ("stat",))
+        self.cache = Gauge("bot_theme_card_cache", "Кеш карточек тем", ("stat",))
+        self.table_rows = Gauge("bot_table_rows", "Число строк в таблицах данных", ("table",))
+        self.save_seconds = Gauge("bot_save_duration_seconds", "Длительность последнего сохранения данных")
+        self.save_total = Counter("bot_saves_total", "Сохранения данных")
+        # функции, обновляющие значения перед выдачей метрик
+        self.collectors = []
+        self.server = None
+
+
+    def all(self):
+        return [value for value in vars(self).values() if isinstance(value, (Counter, Histogram))]
+
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+
+    def render(self):
+        for collector in self.collectors:
+            try:
+                collector(self)
+            except Exception:
+                logger.exception("Ошибка при сборе метрик")
+        lines = []
+        for metric in self.all():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name} {value}" for name, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+    def timed_handler(self, callback):
+        @wraps(callback)
+        async def wrapper(update, context):
+            start = perf_counter()
+            try:
+                return await callback(update, context)
+            except Exception:
+                self.handler_errors.inc(callback.__name__)
+                raise
+            finally:
+                self.handler_seconds.observe(perf_counter() - start, callback.__name__)
+        return wrapper
+
+
+    def instrument(self, application):
+        # оборачиваются обработчики всех групп, включая вложенные в ConversationHandler
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                if isinstance(handler, ConversationHandler):
+                    inner = handler.entry_points + [state for states in handler.states.values() for state in states] + handler.fallbacks
+                else:
+                    inner = [handler]
+                for callback_handler in inner:
+                    callback_handler.callback = self.timed_handler(callback_handler.callback)
+        application.add_handler(TypeHandler(Update, self.count_update), group=-1)
+
+
+    async def count_update(self, update, context):
+        if update.callback_query:
+            kind = "callback_query"
+        elif update.message and update.message.document:
+            kind = "document"
+        elif update.message:
+            kind = "message"
+        else:
+            kind = "other"
+        self.updates.inc(kind)
+
+
+    def start_server(self):
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((config.METRICS_LISTEN, config.METRICS_PORT), MetricsHandler)
+        thread = Thread(target=self.server.serve_forever, name="metrics", daemon=True)
+        thread.start()
+        logger.info("Метрики доступны на http://%s:%d/metrics", config.METRICS_LISTEN, config.METRICS_PORT)
+
+
+class MeteredRequest(HTTPXRequest):
+    # время каждого запроса к Bot API; в адресе метод идет последним, токен в метки не попадает
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        start = perf_counter()
+        try:
+            return await super().do_request(url, method, request_data, *args, **kwargs)
+        finally:
+            Metrics().api_seconds.observe(perf_counter() - start, url.rsplit("/", 1)[-1] if method == "POST" else "download")
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+from datetime import timedelta
+from time import monotonic
+
+from telegram.error import RetryAfter, BadRequest, NetworkError, TelegramError
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class Notifier:
+    def __new__(cls):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(Notifier, cls).__new__(cls)
+            cls.instance.__initialized = False
+        return cls.instance
+
+
+    def __init__(self):
+        if self.__initialized:
+            return
+        self.__initialized = True
+        # время, раньше которого нельзя отправить следующее сообщение: для всего бота и для каждого чата
+        self.next_send = 0
+        self.chat_next_send = {}
+        # до этого времени Telegram запретил отправку после ошибки RetryAfter
+        self.paused_until = 0
+        self.semaphore = asyncio.Semaphore(config.NOTIFY_CONCURRENCY)
+        # ссылки на фоновые рассылки, чтобы задачи не были удалены сборщиком мусора до завершения
+        self.tasks = set()
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        # класс ошибки -> число недоставленных из-за нее уведомлений
+        self.errors = {}
+
+
+    async def wait_turn(self, chat_id):
+        # место в очереди занимается сразу, поэтому параллельные отправки не превышают лимиты
+        now = monotonic()
+        send_at = max(now, self.next_send, self.paused_until, self.chat_next_send.get(chat_id, 0))
+        self.next_send = max(self.next_send, send_at) + 1 / config.NOTIFY_RATE
+        self.chat_next_send[chat_id] = send_at + config.NOTIFY_CHAT_INTERVAL
+        if send_at > now:
+            await asyncio.sleep(send_at - now)
+        if len(self.chat_next_send) > 10000:
+            self.chat_next_send = {chat: moment for chat, moment in self.chat_next_send.items() if moment > now}
+
+
+    async def send(self, bot, chat_id, text):
+        async with self.semaphore:
+            for attempt in range(config.NOTIFY_RETRIES + 1):
+                await self.wait_turn(chat_id)
+                try:
+                    await bot.send_message(chat_id=chat_id, text=text)
+                    self.sent += 1
+                    return True
+                except RetryAfter as error:
+                    delay = error.retry_after
+                    delay = delay.total_seconds() if isinstance(delay, timedelta) else delay
+                    # ограничение действует на весь бот, поэтому останавливаются все отправки
+                    self.paused_until = max(self.paused_until, monotonic() + delay)
+                    reason = error
+                except BadRequest as error:
+                    # наследник NetworkError, но "чат не найден" и подобные ошибки повтором не исправить
+                    return self.give_up(chat_id, error)
+                except NetworkError as error:
+                    delay = min(2 ** attempt, 30)
+                    reason = error
+                except TelegramError as error:
+                    # пользователь заблокировал бота и т.п. - повтор не поможет
+                    return self.give_up(chat_id, error)
+                if attempt < config.NOTIFY_RETRIES:
+                    self.retried += 1
+                    await asyncio.sleep(delay)
+            logger.warning("Уведомление в чат %s не доставлено после %d попыток: %s", chat_id, config.NOTIFY_RETRIES + 1, reason)
+            self.failed += 1
+            self.errors[type(reason).__name__] = self.errors.get(type(reason).__name__, 0) + 1
+            return False
+
+
+    def give_up(self, chat_id, error):
+        logger.info("Уведомление в чат %s не доставлено: %s", chat_id, error)
+        self.failed += 1
+        self.errors[type(error).__name__] = self.errors.get(type(error).__name__, 0) + 1
+        return False
+
+
+    async def send_many(self, bot, chat_ids, text):
+        start = monotonic()
+        results = await asyncio.gather(*[self.send(bot, chat_id, text) for chat_id in chat_ids])
+        if len(results) > 1:
+            logger.info("Рассылка: доставлено %d из %d за %.1f с", sum(results), len(results), monotonic() - start)
+        return results
+
+
+    def notify(self, bot, chat_ids, text):
+        # рассылка идет в фоне, обработчик не ждет ее завершения
+        if not chat_ids:
+            return
+        task = asyncio.create_task(self.send_many(bot, chat_ids, text))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+
+    async def drain(self, application=None):
+        # при остановке бота дожидаемся начатых рассылок
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+    def stats(self):
+        return {"sent": self.sent, "failed": self.failed, "retried": self.retried, "pending": len(self.tasks)}
+
+
+class DigestQueue:
+    def __new__(cls):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(DigestQueue, cls).__new__(cls)
+            cls.instance.__initialized = False
+        return cls.instance
+
+
+    def __init__(self):
+        if self.__initialized:
+            return
+        self.__initialized = True
+        # (leader_id, event_hash, team_hash) -> запросы, ожидающие отправки одним сообщением
+        self.pending = {}
+        self.tasks = set()
+        # устанавливается при остановке бота, чтобы отправить накопленное без ожидания окна
+        self.flush_now = asyncio.Event()
+        self.requests = 0
+        self.messages = 0
+        # задержка от запроса до отправки уведомления по уже отправленным запросам
+        self.delivered_requests = 0
+        self.latency_total = 0
+        self.latency_max = 0
+
+
+    def add(self, bot, leader_id, event_hash, team_hash, event_name, team_name, alias, requester_id):
+        key = (leader_id, event_hash, team_hash)
+        digest = self.pending.get(key)
+        if digest is None:
+            digest = self.pending[key] = {"event_name": event_name, "team_name": team_name, "requests": []}
+            task = asyncio.create_task(self.flush(bot, key))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        digest['requests'].append((alias, requester_id, monotonic()))
+        self.requests += 1
+
+
+    async def flush(self, bot, key):
+        try:
+            await asyncio.wait_for(self.flush_now.wait(), config.DIGEST_WINDOW)
+        except asyncio.TimeoutError:
+            pass
+        digest = self.pending.pop(key)
+        delivered = await Notifier().send(bot, key[0], self.render(digest))
+        if not delivered:
+            # запрос сохранен, но лидер о нем не знает: пользователь может связаться с лидером сам
+            Notifier().notify(bot, [requester_id for _, requester_id, _ in digest['requests']],
+                              f"Уведомить лидера команды \"{digest['team_name']}\" о вашем запросе на присоединение не удалось. "
+                              "Он может принять или отклонить запрос, используя /my_teams. "
+                              "Рекомендуем связаться с лидером для обсуждения вашего участия.")
+
+        now = monotonic()
+        self.messages += 1
+        self.delivered_requests += len(digest['requests'])
+        for _, _, created in digest['requests']:
+            self.latency_total += now - created
+            self.latency_max = max(self.latency_max, now - created)
+
+
+    @staticmethod
+    def render(digest):
+        aliases = [f"@{alias}" for alias, _, _ in digest['requests']]
+        if len(aliases) == 1:
+            return (f"Был отправлен запрос на присоединение к команде \"{digest['team_name']}\" "
+                    f"в мероприятии \"{digest['event_name']}\" от пользователя {aliases[0]}. "
+                    f"Чтобы принять или отклонить запрос, используйте /my_teams.")
+        listed = ", ".join(aliases[:20]) + (f" и ещё {len(aliases) - 20}" if len(aliases) > 20 else "")
+        return (f"Новых запросов на присоединение к команде \"{digest['team_name']}\" "
+                f"в мероприятии \"{digest['event_name']}\": {len(aliases)} ({listed}). "
+                f"Чтобы принять или отклонить запросы, используйте /my_teams.")
+
+
+    async def drain(self, application=None):
+        self.flush_now.set()
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+    def stats(self):
+        # coalescing - сколько запросов в среднем приходится на одно отправленное сообщение
+        return {"requests": self.requests, "messages": self.messages,
+                "coalescing": self.delivered_requests / self.messages if self.messages else 0,
+                "latency_avg": self.latency_total / self.delivered_requests if self.delivered_requests else 0,
+                "latency_max": self.latency_max}
@@ -0,0 +1,155 @@
+import json
+import pickle
+import sqlite3
+import asyncio
+import hashlib
+from threading import Lock
+
+from telegram import TelegramObject
+from telegram.ext import BasePersistence, PersistenceInput
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+"""
+
+
+class SqlitePersistence(BasePersistence):
+    def __init__(self, url, update_interval):
+        super().__init__(store_data=PersistenceInput(callback_data=False), update_interval=update_interval)
+        self.conn = sqlite3.connect(url, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = Lock()
+        # (kind, key) -> хеш последнего записанного значения, неизменившиеся данные не пишутся повторно
+        self.digests = {}
+        # (kind, key) -> новое значение или None для удаления; записывается одной транзакцией
+        self.dirty = {}
+        self.write_task = None
+
+
+    def _load(self, kind):
+        rows = self.conn.execute("SELECT key, value FROM state WHERE kind = ?", (kind,)).fetchall()
+        for key, value in rows:
+            self.digests[(kind, key)] = hashlib.blake2b(value, digest_size=16).digest()
+        return {key: pickle.loads(value) for key, value in rows}
+
+
+    def _update(self, kind, key, data):
+        value = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        digest = hashlib.blake2b(value, digest_size=16).digest()
+        if self.digests.get((kind, key)) == digest:
+            return
+        self.digests[(kind, key)] = digest
+        self.dirty[(kind, key)] = value
+        self._schedule_write()
+
+
+    def _drop(self, kind, key):
+        self.digests.pop((kind, key), None)
+        self.dirty[(kind, key)] = None
+        self._schedule_write()
+
+
+    def _schedule_write(self):
+        # Application вызывает update_* для всех измененных записей подряд, запись начнется после них
+        if self.write_task is None or self.write_task.done():
+            self.write_task = asyncio.get_running_loop().create_task(self._write())
+
+
+    async def _write(self):
+        while self.dirty:
+            dirty, self.dirty = self.dirty, {}
+            await asyncio.to_thread(self._store, dirty)
+
+
+    def _store(self, dirty):
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM state WHERE kind = ? AND key = ?",
+                                  [key for key, value in dirty.items() if value is None])
+            self.conn.executemany("INSERT OR REPLACE INTO state (kind, key, value) VALUES (?, ?, ?)",
+                                  [(*key, value) for key, value in dirty.items() if value is not None])
+
+
+    def _restore_bot(self, data):
+        # бот не сохраняется вместе с объектами Telegram, например chat_data["buttons_message"]
+        for value in data.values():
+            if isinstance(value, TelegramObject):
+                value.set_bot(self.bot)
+        return data
+
+
+    async def get_user_data(self):
+        return {int(key): data for key, data in self._load("user").items()}
+
+
+    async def get_chat_data(self):
+        return {int(key): self._restore_bot(data) for key, data in self._load("chat").items()}
+
+
+    async def get_bot_data(self):
+        return self._load("bot").get("", {})
+
+
+    async def get_callback_data(self):
+        return None
+
+
+    async def get_conversations(self, name):
+        return {tuple(json.loads(key)): state for key, state in self._load("conversation:" + name).items()}
+
+
+    async def update_conversation(self, name, key, new_state):
+        if new_state is None:
+            self._drop("conversation:" + name, json.dumps(list(key)))
+        else:
+            self._update("conversation:" + name, json.dumps(list(key)), new_state)
+
+
+    async def update_user_data(self, user_id, data):
+        self._update("user", str(user_id), data)
+
+
+    async def update_chat_data(self, chat_id, data):
+        self._update("chat", str(chat_id), data)
+
+
+    async def update_bot_data(self, data):
+        self._update("bot", "", data)
+
+
+    async def update_callback_data(self, data):
+        pass
+
+
+    async def drop_user_data(self, user_id):
+        self._drop("user", str(user_id))
+
+
+    async def drop_chat_data(self, chat_id):
+        self._drop("chat", str(chat_id))
+
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+
+    async def flush(self):
+        if self.write_task is not None:
+            await self.write_task
+        if self.dirty:
+            self._store(self.dirty)
+            self.dirty = {}
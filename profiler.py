@@ -0,0 +1,172 @@
+import os
+import sys
+import asyncio
+import logging
+import threading
+from time import sleep, monotonic
+
+from telegram import Update
+from telegram.ext import TypeHandler
+
+import config
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# поток, стоящий в одной из этих функций, ничего не выполняет: цикл событий ждет обновлений, потоки Reader - задач
+IDLE_FILES = ("selectors.py", "threading.py", "queue.py")
+# функции, которые ждут внутри вызова C: свободный поток ThreadPoolExecutor и поток сохранения между сохранениями
+IDLE_FUNCTIONS = {("thread.py", "_worker"), ("main.py", "save_data")}
+
+
+def _thread_group(name):
+    # reader_0, reader_1 ... -> reader
+    return name.rsplit("_", 1)[0] if name.rsplit("_", 1)[-1].isdigit() else name
+
+
+def _format(key):
+    filename, line, name = key
+    if filename.startswith(ROOT):
+        filename = os.path.relpath(filename, ROOT)
+    else:
+        filename = os.path.join(os.path.basename(os.path.dirname(filename)), os.path.basename(filename))
+    return f"{name} ({filename}:{line})"
+
+
+class Profiler:
+    def __new__(cls):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(Profiler, cls).__new__(cls)
+            cls.instance.__initialized = False
+        return cls.instance
+
+
+    def __init__(self):
+        if self.__initialized:
+            return
+        self.__initialized = True
+        # поток выборки существует только во время профилирования, в остальное время профилировщик ничего не стоит
+        self.thread = None
+        self.handler = None
+        self.stopped = threading.Event()
+        self.reset()
+
+
+    def reset(self):
+        self.samples = 0
+        self.updates = 0
+        self.started = self.finished = 0
+        # (файл, строка объявления, функция) -> число выборок, где функция выполнялась сама / была в стеке
+        self.own = {}
+        self.total = {}
+        # группа потоков -> [активные выборки, выборки в ожидании]
+        self.threads = {}
+        # свернутые стеки "f1;f2;f3" -> число выборок, формат flame graph
+        self.stacks = {}
+
+
+    @property
+    def active(self):
+        return self.thread is not None
+
+
+    def start(self):
+        self.reset()
+        self.stopped.clear()
+        self.started = monotonic()
+        self.thread = threading.Thread(target=self.sample_loop, name="profiler", daemon=True)
+        self.thread.start()
+
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.thread = None
+        self.finished = monotonic()
+
+
+    def sample_loop(self):
+        interval = config.PROFILE_INTERVAL / 1000
+        own_ident = threading.get_ident()
+        while not self.stopped.is_set():
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own_ident:
+                    self.record(_thread_group(names.get(ident, "unknown")), frame)
+            self.samples += 1
+            sleep(interval)
+
+
+    def record(self, group, frame):
+        counts = self.threads.setdefault(group, [0, 0])
+        filename = os.path.basename(frame.f_code.co_filename)
+        if filename in IDLE_FILES or (filename, frame.f_code.co_name) in IDLE_FUNCTIONS:
+            counts[1] += 1
+            return
+        counts[0] += 1
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        self.own[stack[0]] = self.own.get(stack[0], 0) + 1
+        # рекурсивная функция учитывается в выборке один раз
+        for key in set(stack):
+            self.total[key] = self.total.get(key, 0) + 1
+        collapsed = ";".join(key[2] for key in reversed(stack))
+        self.stacks[collapsed] = self.stacks.get(collapsed, 0) + 1
+
+
+    async def count_update(self, update, context):
+        self.updates += 1
+
+
+    def begin(self, application):
+        # запускается сразу в обработчике команды, чтобы повторная команда увидела, что профилирование уже идет
+        self.handler = TypeHandler(Update, self.count_update)
+        application.add_handler(self.handler, group=-2)
+        self.start()
+
+
+    async def finish(self, application, seconds, updates=0):
+        # окно профилирования: заданное время или заданное число обновлений, но не дольше PROFILE_MAX_SECONDS
+        try:
+            deadline = self.started + min(seconds, config.PROFILE_MAX_SECONDS)
+            while monotonic() < deadline and not (updates and self.updates >= updates):
+                await asyncio.sleep(0.1)
+        finally:
+            self.stop()
+            application.remove_handler(self.handler, group=-2)
+        logger.info("Профилирование завершено: %.1f с, обновлений %d, выборок %d",
+                    self.finished - self.started, self.updates, self.samples)
+
+
+    def summary(self, top=10):
+        busy = sum(active for active, idle in self.threads.values())
+        lines = [f"Профилирование: {self.finished - self.started:.1f} с, обновлений {self.updates}, "
+                 f"выборок {self.samples} (каждые {config.PROFILE_INTERVAL:g} мс)", ""]
+        for group, (active, idle) in sorted(self.threads.items(), key=lambda item: -item[1][0]):
+            lines.append(f"{group}: занят {100 * active / max(1, active + idle):.0f}% выборок")
+        lines += ["", "Собственное время:"]
+        lines += [f"{100 * count / max(1, busy):5.1f}%  {_format(key)}" for key, count in self._top(self.own, top)]
+        lines += ["", "Функции бота, время с вложенными вызовами:"]
+        lines += [f"{100 * count / max(1, busy):5.1f}%  {_format(key)}"
+                  for key, count in self._top(self.total, top, own_code=True)]
+        return "\n".join(lines)
+
+
+    def report(self, top=100):
+        # полный отчет для файла: больше строк и свернутые стеки для построения flame graph
+        lines = [self.summary(top), "", "Все функции, время с вложенными вызовами:"]
+        busy = sum(active for active, idle in self.threads.values())
+        lines += [f"{100 * count / max(1, busy):5.1f}%  {count:6d}  {_format(key)}" for key, count in self._top(self.total, top)]
+        lines += ["", "Свернутые стеки:"]
+        lines += [f"{stack} {count}" for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1])]
+        return "\n".join(lines) + "\n"
+
+
+    @staticmethod
+    def _top(counts, top, own_code=False):
+        items = [(key, count) for key, count in counts.items()
+                 if not own_code or (key[0].startswith(ROOT) and not key[0].endswith("profiler.py"))]
+        return sorted(items, key=lambda item: -item[1])[:top]
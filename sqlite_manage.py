@@ -0,0 +1,490 @@
+import os
+import sys
+import sqlite3
+from threading import Lock
+
+import config
+from data_manage import Reader, THEME_COLUMNS, TEAM_COLUMNS, read_themes
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS event (
+    event TEXT NOT NULL,
+    organizer_id INTEGER,
+    alias TEXT,
+    max_members INTEGER NOT NULL,
+    event_hash INTEGER NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS theme (
+    event_hash INTEGER NOT NULL,
+    theme TEXT,
+    company TEXT,
+    max_teams INTEGER NOT NULL,
+    responsible TEXT,
+    email TEXT,
+    description TEXT,
+    background TEXT,
+    problem TEXT,
+    expected_result TEXT,
+    theme_hash INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS team (
+    event_hash INTEGER NOT NULL,
+    theme_hash INTEGER NOT NULL,
+    team_name TEXT NOT NULL,
+    leader_id INTEGER NOT NULL,
+    leader_alias TEXT,
+    team_opened INTEGER NOT NULL,
+    team_needs TEXT,
+    team_hash INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS member (
+    member_id INTEGER NOT NULL,
+    alias TEXT,
+    event_hash INTEGER NOT NULL,
+    team_hash INTEGER NOT NULL,
+    accepted INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counter (
+    name TEXT PRIMARY KEY,
+    next_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS event_version (
+    event_hash INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS theme_event_theme ON theme (event_hash, theme_hash);
+CREATE UNIQUE INDEX IF NOT EXISTS team_event_team ON team (event_hash, team_hash);
+CREATE INDEX IF NOT EXISTS team_event_theme ON team (event_hash, theme_hash);
+CREATE INDEX IF NOT EXISTS member_event_team ON member (event_hash, team_hash, accepted);
+CREATE UNIQUE INDEX IF NOT EXISTS member_member_event ON member (member_id, event_hash, team_hash);
+"""
+
+TEAM_FIELDS = ", ".join(TEAM_COLUMNS)
+
+
+class SqliteReader:
+    def __new__(cls):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(SqliteReader, cls).__new__(cls)
+            cls.instance.__initialized = False
+        return cls.instance
+
+
+    def __init__(self):
+        if self.__initialized:
+            return
+        self.__initialized = True
+        self.data_url = config.SQLITE_URL
+        self.conn = sqlite3.connect(self.data_url, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        # транзакции изменения и сохранение из фонового потока не должны пересекаться на общем соединении
+        self.lock = Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        if self._value("SELECT COUNT(*) FROM counter") == 0:
+            self.migrate_ids()
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO counter (name, next_id) VALUES ('version', 1)")
+
+
+    def migrate_ids(self):
+        # раньше идентификаторы получались из hash(), здесь они заменяются на последовательные номера
+        with self.lock, self.conn:
+            event_ids = {row[0]: new_id for new_id, row in
+                         enumerate(self.conn.execute("SELECT event_hash FROM event ORDER BY rowid"), start=1)}
+            theme_ids = {tuple(row): new_id for new_id, row in
+                         enumerate(self.conn.execute("SELECT event_hash, theme_hash FROM theme ORDER BY rowid"), start=1)}
+            team_ids = {tuple(row): new_id for new_id, row in
+                        enumerate(self.conn.execute("SELECT event_hash, team_hash FROM team ORDER BY rowid"), start=1)}
+
+            rows = self.conn.execute("SELECT rowid, event_hash, theme_hash FROM theme").fetchall()
+            self.conn.executemany("UPDATE theme SET theme_hash = ? WHERE rowid = ?",
+                                  [(theme_ids[(event_hash, theme_hash)], rowid) for rowid, event_hash, theme_hash in rows])
+            rows = self.conn.execute("SELECT rowid, event_hash, theme_hash, team_hash FROM team").fetchall()
+            self.conn.executemany("UPDATE team SET theme_hash = ?, team_hash = ? WHERE rowid = ?",
+                                  [(theme_ids[(event_hash, theme_hash)], team_ids[(event_hash, team_hash)], rowid)
+                                   for rowid, event_hash, theme_hash, team_hash in rows])
+            rows = self.conn.execute("SELECT rowid, event_hash, team_hash FROM member").fetchall()
+            self.conn.executemany("UPDATE member SET team_hash = ? WHERE rowid = ?",
+                                  [(team_ids[(event_hash, team_hash)], rowid) for rowid, event_hash, team_hash in rows])
+            for table in ["event", "theme", "team", "member"]:
+                rows = self.conn.execute(f"SELECT rowid, event_hash FROM {table}").fetchall()
+                self.conn.executemany(f"UPDATE {table} SET event_hash = ? WHERE rowid = ?",
+                                      [(event_ids[event_hash], rowid) for rowid, event_hash in rows])
+
+            self._set_next_ids({"event_hash": len(event_ids) + 1, "theme_hash": len(theme_ids) + 1, "team_hash": len(team_ids) + 1})
+
+
+    def _set_next_ids(self, next_ids):
+        self.conn.executemany("INSERT OR REPLACE INTO counter (name, next_id) VALUES (?, ?)", next_ids.items())
+
+
+    def _allocate_ids(self, key, count=1):
+        # вызывается внутри транзакции изменения; номер никогда не переиспользуется, даже после удаления
+        start = self._value("SELECT next_id FROM counter WHERE name = ?", key)
+        self.conn.execute("UPDATE counter SET next_id = ? WHERE name = ?", (start + count, key))
+        return list(range(start, start + count))
+
+
+    def _bump_version(self, event_hash):
+        # вызывается внутри транзакции изменения мероприятия
+        [version] = self._allocate_ids("version")
+        self.conn.execute("INSERT OR REPLACE INTO event_version (event_hash, version) VALUES (?, ?)", (event_hash, version))
+
+
+    def get_event_version(self, event_hash):
+        return self._value("SELECT version FROM event_version WHERE event_hash = ?", event_hash) or 0
+
+
+    def get_table_sizes(self):
+        return {table: self._value(f"SELECT COUNT(*) FROM {table}") for table in ["event", "theme", "team", "member"]}
+
+
+    def memory_report(self):
+        # данные хранятся в файле базы, в памяти процесса только кеш страниц SQLite
+        rows = self.get_table_sizes()
+        try:
+            sizes = {row['tbl_name']: row['bytes'] for row in
+                     self._all("SELECT m.tbl_name, SUM(s.pgsize) AS bytes FROM dbstat s JOIN sqlite_master m ON m.name = s.name "
+                               "GROUP BY m.tbl_name")}
+        except sqlite3.OperationalError:
+            # SQLite собран без dbstat
+            sizes = {}
+        tables = {table: {"rows": count, "bytes": sizes.get(table)} for table, count in rows.items()}
+        cache_size = self._value("PRAGMA cache_size")
+        page_size = self._value("PRAGMA page_size")
+        return {"backend": "sqlite", "tables": tables,
+                "total_bytes": self._value("PRAGMA page_count") * page_size,
+                # отрицательное значение cache_size задается в КиБ, положительное - в страницах
+                "cache_limit_bytes": -cache_size * 1024 if cache_size < 0 else cache_size * page_size}
+
+
+    def _execute(self, sql, args):
+        # именованные параметры передаются одним словарем
+        if len(args) == 1 and isinstance(args[0], dict):
+            args = args[0]
+        return self.conn.execute(sql, args)
+
+
+    def _all(self, sql, *args):
+        return [dict(row) for row in self._execute(sql, args)]
+
+
+    def _one(self, sql, *args):
+        row = self._execute(sql, args).fetchone()
+        return None if row is None else dict(row)
+
+
+    def _value(self, sql, *args):
+        row = self._execute(sql, args).fetchone()
+        return None if row is None else row[0]
+
+
+    def _is_participant(self, member_id, event_hash):
+        return self._value("SELECT 1 FROM member WHERE member_id = ? AND event_hash = ? AND accepted = 1",
+                           member_id, event_hash) is not None
+
+
+    def is_event_name_unique(self, name: str):
+        return self._value("SELECT 1 FROM event WHERE event = ?", name) is None
+
+
+    @staticmethod
+    def is_digit(number: str):
+        return number.isdigit()
+
+
+    def add_event_theme(self, event_name, org_id, alias, max_members, file_url):
+        errors, themes = read_themes(file_url)
+        os.remove(file_url)
+        if errors:
+            return errors
+        # ошибка возвращается списком, как ошибки файла, иначе пустой список приняли бы за успех
+        if self.add_event(event_name, org_id, alias, max_members, themes) == 1:
+            return ["К сожалению, уже появилось мероприятие с таким названием. Напишите другое название."]
+        return errors
+
+
+    def add_event(self, event_name, org_id, alias, max_members, themes):
+        with self.lock, self.conn:
+            if not self.is_event_name_unique(event_name):
+                return 1
+            [event_hash] = self._allocate_ids("event_hash")
+            theme_hashes = self._allocate_ids("theme_hash", len(themes))
+            self.conn.execute("INSERT INTO event (event, organizer_id, alias, max_members, event_hash) VALUES (?, ?, ?, ?, ?)",
+                              (event_name, org_id, alias, max_members, event_hash))
+            self.conn.executemany(f"INSERT INTO theme (event_hash, {', '.join(THEME_COLUMNS)}, theme_hash) "
+                                  f"VALUES (?, {', '.join('?' * len(THEME_COLUMNS))}, ?)",
+                                  [(event_hash, *[_none(theme[col]) for col in THEME_COLUMNS], theme_hash)
+                                   for theme, theme_hash in zip(themes, theme_hashes)])
+            self._bump_version(event_hash)
+
+
+    def get_events(self):
+        return self._all("SELECT event, event_hash FROM event ORDER BY rowid")
+
+
+    def get_event_name(self, event_hash):
+        return self._value("SELECT event FROM event WHERE event_hash = ?", event_hash)
+
+
+    def get_themes_to_create(self, leader_id, event_hash):
+        if self._is_participant(leader_id, event_hash):
+            return 1
+        return self._all("SELECT theme, theme_hash FROM theme th WHERE event_hash = ? AND max_teams > "
+                         "(SELECT COUNT(*) FROM team t WHERE t.event_hash = th.event_hash AND t.theme_hash = th.theme_hash) "
+                         "ORDER BY rowid", event_hash)
+
+
+    def theme_info(self, event_hash, theme_hash):
+        return self._one(f"SELECT e.event, {', '.join('th.' + col for col in THEME_COLUMNS)}, th.theme_hash "
+                         "FROM theme th JOIN event e ON e.event_hash = th.event_hash "
+                         "WHERE th.event_hash = ? AND th.theme_hash = ?", event_hash, theme_hash)
+
+
+    def is_create_theme_available(self, leader_id, event_hash, theme_hash):
+        if self._is_participant(leader_id, event_hash):
+            return False
+        teams_count = self._value("SELECT COUNT(*) FROM team WHERE event_hash = ? AND theme_hash = ?", event_hash, theme_hash)
+        max_teams = self._value("SELECT max_teams FROM theme WHERE event_hash = ? AND theme_hash = ?", event_hash, theme_hash)
+
+        return teams_count < max_teams
+
+
+    def get_theme_name(self, event_hash, theme_hash):
+        return self._value("SELECT theme FROM theme WHERE event_hash = ? AND theme_hash = ?", event_hash, theme_hash)
+
+
+    def is_team_name_unique(self, event_hash, team_name):
+        return self._value("SELECT 1 FROM team WHERE event_hash = ? AND team_name = ?", event_hash, team_name) is None
+
+
+    def add_team(self, event_hash, theme_hash, team_name, leader_id, l_alias, description):
+        with self.lock, self.conn:
+            [team_hash] = self._allocate_ids("team_hash")
+            self.conn.execute(f"INSERT INTO team ({TEAM_FIELDS}) VALUES (?, ?, ?, ?, ?, 1, ?, ?)",
+                              (event_hash, theme_hash, team_name, leader_id, l_alias, description, team_hash))
+            self.conn.execute("INSERT INTO member (member_id, alias, event_hash, team_hash, accepted) VALUES (?, ?, ?, ?, 1)",
+                              (leader_id, l_alias, event_hash, team_hash))
+            self._bump_version(event_hash)
+
+
+    def get_themes_to_join(self, member_id, event_hash):
+        if self._is_participant(member_id, event_hash):
+            return 1
+
+        return self._all("SELECT theme, theme_hash FROM theme th WHERE event_hash = :event AND EXISTS ("
+                         "SELECT 1 FROM team t WHERE t.event_hash = :event AND t.theme_hash = th.theme_hash AND t.team_opened = 1 "
+                         "AND (SELECT COUNT(*) FROM member m WHERE m.event_hash = :event AND m.team_hash = t.team_hash AND m.accepted = 1) "
+                         "< (SELECT max_members FROM event WHERE event_hash = :event) "
+                         "AND NOT EXISTS (SELECT 1 FROM member m WHERE m.member_id = :member AND m.event_hash = :event "
+                         "AND m.team_hash = t.team_hash)) ORDER BY rowid", {"event": event_hash, "member": member_id})
+
+
+    def get_theme_options(self, member_id, event_hash, theme_hash):
+        if self._is_participant(member_id, event_hash):
+            return 1
+
+        options = self._one("SELECT EXISTS (SELECT 1 FROM team t WHERE t.event_hash = :event AND t.theme_hash = :theme "
+                            "AND t.team_opened = 1 "
+                            "AND (SELECT COUNT(*) FROM member m WHERE m.event_hash = :event AND m.team_hash = t.team_hash AND m.accepted = 1) "
+                            "< (SELECT max_members FROM event WHERE event_hash = :event) "
+                            "AND NOT EXISTS (SELECT 1 FROM member m WHERE m.member_id = :member AND m.event_hash = :event "
+                            "AND m.team_hash = t.team_hash)) AS \"join\", "
+                            "(SELECT max_teams FROM theme WHERE event_hash = :event AND theme_hash = :theme) > "
+                            "(SELECT COUNT(*) FROM team WHERE event_hash = :event AND theme_hash = :theme) AS \"create\"",
+                            {"event": event_hash, "theme": theme_hash, "member": member_id})
+        return {"join": bool(options['join']), "create": bool(options['create'])}
+
+
+    def get_teams_to_join(self, leader_id, event_hash, theme_hash):
+        if self._is_participant(leader_id, event_hash):
+            return 1
+
+        return self._all("SELECT team_name, team_hash FROM team t WHERE event_hash = :event AND theme_hash = :theme AND team_opened = 1 "
+                         "AND (SELECT COUNT(*) FROM member m WHERE m.event_hash = :event AND m.team_hash = t.team_hash) "
+                         "< (SELECT max_members FROM event WHERE event_hash = :event) ORDER BY rowid",
+                         {"event": event_hash, "theme": theme_hash})
+
+
+    def get_team_description(self, event_hash, team_hash):
+        return self._value("SELECT team_needs FROM team WHERE event_hash = ? AND team_hash = ?", event_hash, team_hash)
+
+
+    def get_team_name(self, event_hash, team_hash):
+        return self._value("SELECT team_name FROM team WHERE event_hash = ? AND team_hash = ?", event_hash, team_hash)
+
+
+    def add_member_to_team(self, member_id, member_alias, event_hash, team_hash):
+        with self.lock, self.conn:
+            if self._is_participant(member_id, event_hash):
+                return 1
+
+            team = self._one("SELECT leader_id, leader_alias, team_name, team_opened FROM team WHERE event_hash = ? AND team_hash = ?",
+                             event_hash, team_hash)
+            if (team is None or not team['team_opened'] or
+                self.get_current_members(event_hash, team_hash) >= self.get_max_members(event_hash)):
+                return 2
+
+            self.conn.execute("INSERT OR IGNORE INTO member (member_id, alias, event_hash, team_hash, accepted) VALUES (?, ?, ?, ?, 0)",
+                              (member_id, member_alias, event_hash, team_hash))
+            self._bump_version(event_hash)
+        return {"leader_id": team["leader_id"], "leader_alias": team['leader_alias'], "team_name": team['team_name']}
+
+
+    def get_member_events(self, member_id):
+        return self._all("SELECT event, event_hash FROM event WHERE event_hash IN "
+                         "(SELECT event_hash FROM member WHERE member_id = ? AND accepted = 1) ORDER BY rowid", member_id)
+
+
+    def get_team_info(self, member_id, event_hash):
+        team = self._one(f"SELECT {TEAM_FIELDS} FROM team WHERE event_hash = ? AND team_hash = "
+                         "(SELECT team_hash FROM member WHERE member_id = ? AND event_hash = ? AND accepted = 1)",
+                         event_hash, member_id, event_hash)
+        if team is not None:
+            team['team_opened'] = bool(team['team_opened'])
+        return team
+
+
+    def get_team_dashboard(self, member_id, event_hash):
+        dashboard = self._one("SELECT e.event, th.theme, t.team_hash, t.team_name, t.leader_id, t.leader_alias, t.team_opened, t.team_needs, "
+                              "(SELECT COUNT(*) FROM member a WHERE a.event_hash = t.event_hash AND a.team_hash = t.team_hash "
+                              "AND a.accepted = 1) AS members, e.max_members "
+                              "FROM member m JOIN team t ON t.event_hash = m.event_hash AND t.team_hash = m.team_hash "
+                              "JOIN event e ON e.event_hash = t.event_hash "
+                              "JOIN theme th ON th.event_hash = t.event_hash AND th.theme_hash = t.theme_hash "
+                              "WHERE m.member_id = ? AND m.event_hash = ? AND m.accepted = 1", member_id, event_hash)
+        if dashboard is not None:
+            dashboard['team_opened'] = bool(dashboard['team_opened'])
+        return dashboard
+
+
+    def get_max_members(self, event_hash):
+        return self._value("SELECT max_members FROM event WHERE event_hash = ?", event_hash)
+
+
+    def get_current_members(self, event_hash, team_hash):
+        return self._value("SELECT COUNT(*) FROM member WHERE event_hash = ? AND team_hash = ? AND accepted = 1", event_hash, team_hash)
+
+
+    def get_not_accepted_members(self, event_hash, team_hash):
+        return self._all("SELECT member_id, alias FROM member WHERE event_hash = ? AND team_hash = ? AND accepted = 0 ORDER BY rowid",
+                         event_hash, team_hash)
+
+
+    def get_user_alias(self, member_id):
+        return self._value("SELECT alias FROM member WHERE member_id = ? ORDER BY rowid LIMIT 1", member_id)
+
+
+    def accept_member(self, event_hash, team_hash, member_id):
+        with self.lock, self.conn:
+            if self._is_participant(member_id, event_hash):
+                return 2
+            max_members = self.get_max_members(event_hash)
+            cur_members = self.get_current_members(event_hash, team_hash)
+            if max_members == cur_members:
+                return 1
+
+            updated = self.conn.execute("UPDATE member SET accepted = 1 WHERE event_hash = ? AND team_hash = ? AND member_id = ?",
+                                        (event_hash, team_hash, member_id)).rowcount
+            if updated == 0:
+                return 2
+
+            self.conn.execute("DELETE FROM member WHERE event_hash = ? AND member_id = ? AND accepted = 0", (event_hash, member_id))
+            self._bump_version(event_hash)
+
+        return [max_members, cur_members+1]
+
+
+    def remove_member(self, event_hash, team_hash, member_id):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM member WHERE event_hash = ? AND team_hash = ? AND member_id = ?",
+                              (event_hash, team_hash, member_id))
+            self._bump_version(event_hash)
+
+
+    def flip_team_opened(self, event_hash, team_hash):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE team SET team_opened = 1 - team_opened WHERE event_hash = ? AND team_hash = ?",
+                              (event_hash, team_hash))
+            self._bump_version(event_hash)
+
+
+    def get_team_members(self, leader_id, event_hash, team_hash):
+        return self._all("SELECT member_id, alias FROM member WHERE event_hash = ? AND team_hash = ? AND accepted = 1 "
+                         "AND member_id != ? ORDER BY rowid", event_hash, team_hash, leader_id)
+
+
+    def change_team_needs(self, event_hash, team_hash, description):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE team SET team_needs = ? WHERE event_hash = ? AND team_hash = ?",
+                              (description, event_hash, team_hash))
+            self._bump_version(event_hash)
+
+
+    def delete_team(self, event_hash, team_hash, leader_id):
+        with self.lock, self.conn:
+            members_deleted = [row['member_id'] for row in self.get_team_members(leader_id, event_hash, team_hash)]
+            self.conn.execute("DELETE FROM member WHERE event_hash = ? AND team_hash = ?", (event_hash, team_hash))
+            self.conn.execute("DELETE FROM team WHERE event_hash = ? AND team_hash = ?", (event_hash, team_hash))
+            self._bump_version(event_hash)
+
+        return members_deleted
+
+
+    def get_leader_id(self, event_hash, team_hash):
+        return self._value("SELECT leader_id FROM team WHERE event_hash = ? AND team_hash = ?", event_hash, team_hash)
+
+
+    def get_all_themes(self, event_hash):
+        return self._all("SELECT theme, theme_hash FROM theme WHERE event_hash = ? ORDER BY rowid", event_hash)
+
+
+    def get_user_events(self, organizer_id):
+        return self._all("SELECT event, event_hash FROM event WHERE organizer_id = ? ORDER BY rowid", organizer_id)
+
+
+    def delete_event(self, event_hash):
+        with self.lock, self.conn:
+            members_deleted = [row[0] for row in self.conn.execute(
+                "SELECT member_id FROM member WHERE event_hash = ? GROUP BY member_id ORDER BY MIN(rowid)", (event_hash,))]
+            for table in ["member", "team", "theme", "event"]:
+                self.conn.execute(f"DELETE FROM {table} WHERE event_hash = ?", (event_hash,))
+            self._bump_version(event_hash)
+
+        return members_deleted
+
+
+    def save_data(self):
+        # данные уже записаны транзакциями, здесь только переносим WAL в основной файл
+        with self.lock:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def _none(value):
+    # пустые ячейки xlsx приходят как nan
+    return None if value != value else value
+
+
+def migrate():
+    reader = Reader()
+    sqlite_reader = SqliteReader()
+    with sqlite_reader.conn as conn:
+        for table, df in [("event", reader.event_df), ("theme", reader.theme_df), ("team", reader.team_df), ("member", reader.member_df)]:
+            # в старых выгрузках бывают лишние и переименованные столбцы, переносятся только столбцы схемы
+            schema_columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+            columns = [col for col in schema_columns if col in df.columns]
+            conn.execute(f"DELETE FROM {table}")
+            conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                             [tuple(_none(row[col]) for col in columns) for row in df.to_dict('records')])
+        sqlite_reader._set_next_ids(reader.next_ids)
+    print(f"Данные из {reader.data_url} перенесены в {sqlite_reader.data_url}.")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ["migrate"]:
+        migrate()
+    else:
+        print("Использование: python sqlite_manage.py migrate")
@@ -0,0 +1,60 @@
+import asyncio
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class UserOrderedUpdateProcessor(BaseUpdateProcessor):
+    # обновления разных пользователей обрабатываются параллельно,
+    # обновления одного пользователя и одного чата - строго по очереди
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self.locks = {}
+
+
+    async def process_update(self, update, coroutine):
+        # в отличие от BaseUpdateProcessor очередь своего пользователя или чата ждут до входа в семафор,
+        # иначе ожидающие обновления одного пользователя занимали бы места, общие для всех
+        keys = []
+        if isinstance(update, Update):
+            if update.effective_chat:
+                keys.append(("chat", update.effective_chat.id))
+            if update.effective_user:
+                keys.append(("user", update.effective_user.id))
+
+        # блокировки берутся всегда в одном порядке (чат, затем пользователь), поэтому взаимной блокировки нет;
+        # задачу могут отменить во время ожидания, тогда освобождаются только уже взятые блокировки
+        registered = []
+        held = []
+        try:
+            for key in keys:
+                lock, waiting = self.locks.get(key, (asyncio.Lock(), 0))
+                self.locks[key] = (lock, waiting + 1)
+                registered.append(key)
+                await lock.acquire()
+                held.append(key)
+            async with self._semaphore:
+                await self.do_process_update(update, coroutine)
+        finally:
+            # отмена до начала обработки: обновление так и не будет обработано; для завершенной корутины close ничего не делает
+            coroutine.close()
+            for key in reversed(registered):
+                lock, waiting = self.locks[key]
+                if key in held:
+                    lock.release()
+                if waiting == 1:
+                    del self.locks[key]
+                else:
+                    self.locks[key] = (lock, waiting - 1)
+
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+
+    async def initialize(self):
+        pass
+
+
+    async def shutdown(self):
+        self.locks.clear()
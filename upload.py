@@ -0,0 +1,71 @@
+import io
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import config
+from data_manage import read_themes
+
+
+def parse_themes(content):
+    # выполняется в отдельном процессе: разбор xlsx не блокирует обработку обновлений
+    try:
+        return read_themes(io.BytesIO(content))
+    except Exception:
+        return ["Не удалось прочитать файл. Проверьте, что файл создан по шаблону."], []
+
+
+class ThemesUploader:
+    def __new__(cls):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(ThemesUploader, cls).__new__(cls)
+            cls.instance.__initialized = False
+        return cls.instance
+
+
+    def __init__(self):
+        if self.__initialized:
+            return
+        self.__initialized = True
+        self.executor = self.create_executor()
+        self.semaphore = asyncio.Semaphore(config.MAX_CONCURRENT_UPLOADS)
+
+
+    @staticmethod
+    def create_executor():
+        # spawn вместо fork: в процессе бота уже работают потоки Reader и сохранения
+        return ProcessPoolExecutor(max_workers=config.UPLOAD_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+
+    def is_busy(self):
+        return self.semaphore.locked()
+
+
+    async def read_themes(self, document, progress):
+        async with self.semaphore:
+            await progress.edit_text("Загрузка файла...")
+            to_download = await document.get_file()
+            content = await to_download.download_as_bytearray()
+            if len(content) > config.MAX_UPLOAD_SIZE:
+                return [self.size_error()], []
+
+            await progress.edit_text("Проверка тем...")
+            loop = asyncio.get_running_loop()
+            executor = self.executor
+            try:
+                return await loop.run_in_executor(executor, partial(parse_themes, bytes(content)))
+            except BrokenProcessPool:
+                # процесс разбора аварийно завершился, следующие загрузки пойдут в новый пул;
+                # старый пул закрывается, иначе остаются его управляющий поток и каналы.
+                # параллельная загрузка могла уже заменить пул, тогда новый не трогаем
+                if self.executor is executor:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    self.executor = self.create_executor()
+                return ["Не удалось обработать файл. Отправьте файл заново."], []
+
+
+    @staticmethod
+    def size_error():
+        return f"Файл слишком большой: максимальный размер {config.MAX_UPLOAD_SIZE // 1024} КБ."